@@ -1,23 +1,18 @@
-import ternary
-import mpltern
-import eurostat
 import json
 
-import plotly.express as px
-import matplotlib.pyplot as plt
+from functools import partial
+
 import streamlit as st
-import pandas as pd
-import numpy as np
-import matplotlib.cm as cm 
-import plotly.express as px
 
-from sklearn.preprocessing import MinMaxScaler, StandardScaler
+import settings
 
 from text_to_print import description_text_by_quarter, description_text_by_countries, load_md_introduction, load_md_methodology, load_md_howto, load_md_welcome, load_md_box_plot
-from data_processing import process_import_data, process_ICT_labour_import_data
 from utils import debug_print, info_print, error_print
 from data_rendering import css
 
+# The plotting and data stacks (matplotlib, plotly, pandas, pyarrow) are imported lazily, by the
+# pages needing them: the Home and Intro pages are served without loading them
+
 # Set the page configuration at the top of the script
 st.set_page_config(
     page_title="B&DT Club Digital Transformation Indicator",  # Optional: Give your app a title
@@ -40,164 +35,111 @@ page = st.radio('Select a page',[page1, page2, page3, page4], horizontal=True, l
 st.html(css['logo'])
 st.logo(image="logo/DTPI_logo_v5.png")
 
-# Normalize the data using Min-Max scaling
-scaler = MinMaxScaler()
-
 # weights for the index
-w1 = w2 = w3 = 1  # weights for index calc. w1 - GVA, w2 - Employment, w3 - Labour Demand 
+w1, w2, w3 = settings.weights  # weights for index calc. w1 - GVA, w2 - Employment, w3 - Labour Demand 
 
 # moving average window defined by slider
 #window = st.sidebar.slider("Select moving average window", 1, 5, 2)  # Slider to select the window size
 #ste window to a fixed value
-window = 3
+window = settings.window
 
 # List of countries for which to process and plot data
 # List of countries and titles
-countries = ['EU27_2020', 'IT', 'FR', 'DE', 'ES', 'NL', 'SE']
-country_titles = ['Europe 27 (EU27)', 'Italy (IT)', 'France (FR)', 'Germany (DE)', 'Spain (ES)', 'Netherlands (NL)', 'Sweden (SE)']
+countries = list(settings.countries)
+country_titles = list(settings.country_titles)
 data_to_import = ['GVA', 'employment', 'labour_demand']
 #countries = ['IT', 'FR', 'DE']  # Italy, France, and Germany
 
-# Caching data to save time in loading data from API call
-@st.cache_data
-def load_data():
-    # Load the raw data from Eurostat API
-    GVA_data_import = eurostat.get_data_df('namq_10_a10')
-    info_print("Got GVA data")
-    Employment_data_import = eurostat.get_data_df('namq_10_a10_e')
-    info_print("Got Employment data")
-    Labour_demand_ICT_data_import = eurostat.get_data_df('isoc_sk_oja1')
-    info_print("Got Labour Demand data")
-    
-    # Define the starting quarter for filtering data
-    date_start = '2019Q4'
-
-    # Process the raw data
-    GVA_data = process_import_data(GVA_data_import, date_start)
-    Employment_data = process_import_data(Employment_data_import, date_start)
-    Labour_demand_ICT_data = process_ICT_labour_import_data(Labour_demand_ICT_data_import, date_start)
-
-   
-
-    return GVA_data, Employment_data, Labour_demand_ICT_data
-
-with st.spinner("Please wait, loading data..."):
-    # Load the data from the cached function
-    GVA_data, Employment_data, Labour_demand_ICT_data = load_data()
-    info_print("All data has been loaded")
-
-# Create an empty data frame to hold the hold data during transformation
-transformed_data = pd.DataFrame()
-
-# Create an empty list to store individual filtered data frames before merging
-loaded_data_list = []
-
-# Iterate over each country in the list of countries
-for country in countries:
-    # Filter GVA data for the given country, where the sector is 'J', unit is 'PC_GDP', item is 'B1G', and data is not seasonally adjusted
-    filtered_data_GVA = GVA_data[(GVA_data['nace_r2'] == 'J') & 
-                                 (GVA_data['unit'] == 'PC_GDP') & 
-                                 (GVA_data['geo'] == country) & 
-                                 (GVA_data['na_item'] == 'B1G') & 
-                                 (GVA_data['s_adj'] == 'NSA')].copy()
-
-    # Select only 'quarter' and 'value' columns, rename 'value' to 'GVA_value'
-    filtered_data_GVA = filtered_data_GVA[['quarter', 'value']]
-    filtered_data_GVA = filtered_data_GVA.rename(columns={'value': f'{country}_GVA_value'})
-
-    # Filter employment data for the given country, with similar filtering criteria (for employment)
-    filtered_data_employment = Employment_data[(Employment_data['nace_r2'] == 'J') & 
-                                               (Employment_data['unit'] == 'PC_TOT_PER') & 
-                                               (Employment_data['geo'] == country) & 
-                                               (Employment_data['na_item'] == 'EMP_DC') & 
-                                               (Employment_data['s_adj'] == 'NSA')].copy()
-
-    # Select only 'quarter' and 'value' columns, rename 'value' to 'employment_value'
-    filtered_data_employment = filtered_data_employment[['quarter', 'value']]
-    filtered_data_employment = filtered_data_employment.rename(columns={'value': f'{country}_employment_value'})
-
-    # Filter labor demand data for the given country, similar criteria
-    filtered_data_labour_demand = Labour_demand_ICT_data[(Labour_demand_ICT_data['geo'] == country) &
-                                                         (Labour_demand_ICT_data['unit'] == 'PC')].copy()
-
-    # Select only 'quarter' and 'value' columns, rename 'value' to 'employment_value'
-    filtered_data_labour_demand = filtered_data_labour_demand[['quarter', 'value']]
-    filtered_data_labour_demand = filtered_data_labour_demand.rename(columns={'value': f'{country}_labour_demand_value'})
-
-    # Merge GVA data and employment data on the 'quarter' column, keep only common entries (inner join)
-    merged_data = pd.merge(filtered_data_GVA, filtered_data_employment, on='quarter', how='inner')
-
-    # Merge the resulting data frame with labor demand data on the 'quarter' column
-    merged_data = pd.merge(merged_data, filtered_data_labour_demand, on='quarter', how='inner')
-    # Set 'quarter' as the index
-    merged_data.set_index('quarter', inplace=True)
-
-    # Append the merged data for this country to the list
-    loaded_data_list.append(merged_data)
-
-# Concatenate all merged data frames from the list into one data frame
-transformed_data = pd.concat(loaded_data_list, axis=1, join='inner')
-transformed_data.index = transformed_data.index.strftime('%y-Q%q')
-
-# list of the measures to use in the loop
-data_measures = ['GVA', 'employment', 'labour_demand']
-
-for country in countries:
-    for measure in data_measures:
-        # Calculate the moving average for the specified measure for each country
-        moving_average = transformed_data[f'{country}_{measure}_value'].rolling(window=window).mean()
-
-        # Drop NaN values in the moving average 
-        moving_average.dropna(inplace=True)
-
-        # Assign the calculated moving average to the DataFrame
-        transformed_data[f'{country}_{measure}_moving_average_value'] = moving_average
-
-        # Normalize the moving average using MinMaxScaler
-        moving_average_values = moving_average.values.reshape(-1,1)  # reshape to fit method's requirements
-        normalized_values = scaler.fit_transform(moving_average_values)
-
-        # Convert normalized values back to a Series with the correct index
-        normalized_moving_average = pd.Series(normalized_values.flatten(), index=moving_average.index)
-
-        # Assign the normalized moving average to a new column in the DataFrame and reindex
-        transformed_data[f'{country}_{measure}_normalized_moving_average_value'] = (
-            normalized_moving_average.reindex(transformed_data.index)
-        )
-
-transformed_data.dropna(inplace=True)
-
-# Initialize an empty DataFrame to hold the index values for all countries
-index_data = pd.DataFrame(index=transformed_data.index)
-
-for country in countries:
-    # Calculate the index as the sum of normalized values
-    index_data[f'{country}'] = (
-        w1*transformed_data[f'{country}_GVA_normalized_moving_average_value'] +
-        w2*transformed_data[f'{country}_employment_normalized_moving_average_value'] +
-        w3*transformed_data[f'{country}_labour_demand_normalized_moving_average_value']
-    )/(w1+w2+w3)
-    index_data.dropna(inplace=True)
-
-# Set global font size for plots
-plt.rcParams.update({'font.size': 12,
-                    'figure.facecolor': '#002f6c',  # Background color of the figure
-                    'axes.facecolor': '#002f6c',    # Background color of the plot area
-                    'axes.edgecolor': '#e5e5e5',    # Border color of the plot
-                    'axes.labelcolor': '#e5e5e5',   # Color of the axis labels
-                    'xtick.color': '#e5e5e5',       # Color of the x-tick labels
-                    'ytick.color': '#e5e5e5',       # Color of the y-tick labels
-                    'text.color': '#e5e5e5',        # Default text color
-                    'axes.titlecolor': '#e5e5e5',   # Color of the title text
-                    'grid.color': '#e5e5e5',        # Color of the grid lines
-                     })
+# Cache backend shared by the sessions of this process, selected via the CACHE_BACKEND secret:
+# memory (per process), disk (per node, pickled) or arrow (per node, memory-mapped and zero-copy)
+@st.cache_resource
+def get_data_cache():
+    from data_cache import get_cache_backend
+
+    return get_cache_backend(st.secrets.get('CACHE_BACKEND', 'memory'))
+
+# Processed outputs, persisted as Arrow IPC files that every process on the node opens memory-mapped
+@st.cache_resource
+def get_artifact_store():
+    from data_cache import ArrowCacheBackend
+
+    return ArrowCacheBackend()
+
+# Scheduler refreshing the processed outputs in the background, selected via the REFRESH_SCHEDULER
+# secret: thread (in this process) or off (e.g. when running refresh_scheduler.py as a worker)
+@st.cache_resource
+def get_refresh_scheduler():
+    from data_processing import build_dtpi_data
+    from data_sources import get_data_source
+    from refresh_scheduler import RefreshScheduler, default_interval
+    from vintage_store import VintageStore, default_vintage_dir
+
+    scheduler = RefreshScheduler(get_data_source(st.secrets.get('DATA_SOURCE', 'eurostat')),
+                                 get_artifact_store(),
+                                 raw_cache=get_data_cache(),
+                                 interval=int(st.secrets.get('REFRESH_INTERVAL', default_interval)),
+                                 build=partial(build_dtpi_data, countries=list(countries), window=window, weights=(w1, w2, w3)),
+                                 vintage_store=VintageStore(st.secrets.get('VINTAGE_DIR', default_vintage_dir)))
+    if st.secrets.get('REFRESH_SCHEDULER', 'thread') == 'thread':
+        scheduler.start()
+
+    return scheduler
+
+def load_dtpi_table():
+    from refresh_scheduler import artifact_key
+
+    store = get_artifact_store()
+    # Started by the first page showing the data: the Home and Intro pages neither load the data
+    # stack nor poll the source. The polls run in the thread of the scheduler
+    scheduler = get_refresh_scheduler()
+    processed_data = store.open_tables(artifact_key)
+    if processed_data is None:
+        # Nothing has been built yet on this node: build it now, once (the other processes wait)
+        with st.spinner("Please wait, loading data..."):
+            scheduler.check()
+        processed_data = store.open_tables(artifact_key)
+    info_print("Processed data has been mapped")
+
+    # Only the mapped table is returned: the data is read when selected, page by page
+    return processed_data[artifact_key]
+
+def import_pyplot():
+    import matplotlib.pyplot as plt
+
+    # Set global font size for plots
+    plt.rcParams.update({'font.size': 12,
+                        'figure.facecolor': '#002f6c',  # Background color of the figure
+                        'axes.facecolor': '#002f6c',    # Background color of the plot area
+                        'axes.edgecolor': '#e5e5e5',    # Border color of the plot
+                        'axes.labelcolor': '#e5e5e5',   # Color of the axis labels
+                        'xtick.color': '#e5e5e5',       # Color of the x-tick labels
+                        'ytick.color': '#e5e5e5',       # Color of the y-tick labels
+                        'text.color': '#e5e5e5',        # Default text color
+                        'axes.titlecolor': '#e5e5e5',   # Color of the title text
+                        'grid.color': '#e5e5e5',        # Color of the grid lines
+                         })
+
+    return plt
+
+def show_figure(plt, fig, view):
+    savefig = fig.savefig
+
+    def accounted_savefig(image, *args, **kwargs):
+        savefig(image, *args, **kwargs)
+        # st.pyplot renders the figure into an in-memory PNG, kept by the media storage of the
+        # server until the next run of the session: its size is charged to the session
+        view.charge(image.tell(), 'figure')
+
+    fig.savefig = accounted_savefig
+    st.pyplot(fig)
+    # Released at once: pyplot keeps every figure it creates open until closed, run after run
+    plt.close(fig)
 
 # The final DataFrame will automatically handle different lengths because of concatenation
 #st.write('Custom gradients (raw and normalized) for Employment, GVA, and Labour Demand across countries')
 #st.dataframe(custom_gradients_df)
 
 if page == page1:
-    st.success("All datasets loaded successfully", icon="⚙️")
     st.info("Datasets are refreshed quarterly at the source", icon="📬")
 
     st.title('Home page of the Business and Digital Transformation Club DTPI')
@@ -225,16 +167,31 @@ elif page == page3:
     st.info("Datasets are refreshed quarterly at the source", icon="📬")
     st.title("Summarising the DTPI for EU27 with the ability to select and compare")
 
-    countries_withoutEU27 = countries.remove('EU27_2020')
+    import pandas as pd
+
+    from session_view import SessionView, get_shared_data
+
+    plt = import_pyplot()
+    dtpi_table = load_dtpi_table()
+
+    # The data is shared by the sessions of the process, the session only holds its projections
+    view = SessionView(*get_shared_data(dtpi_table), st.session_state)
+
+    # A new list: the module-level countries must not be modified, they are the same at each rerun
+    countries_withoutEU27 = [country for country in countries if country != 'EU27_2020']
     st.markdown(f'{load_md_box_plot()}', unsafe_allow_html=True, help=None)
-    options = st.multiselect("**Default is EU6, select one or more countries to compare...**", countries,placeholder="Choose one or more options", disabled=False, label_visibility="visible")
+    options = st.multiselect("**Default is EU6, select one or more countries to compare...**", countries_withoutEU27, max_selections=view.max_series, placeholder="Choose one or more options", disabled=False, label_visibility="visible")
     if not options:
-        options = countries
+        options = countries_withoutEU27
+    # Enforced also on the default selection
+    options = view.limit(options)
     
     col1, col2 = st.columns([1,1])
 
+    index_data = view.index_frame(['EU27_2020'] + options)
     if isinstance(index_data.index, pd.PeriodIndex):
-                  index_data.index = index_data.index.to_timestamp()
+                  # Not in place: the projection is kept by the session for the next reruns
+                  index_data = index_data.set_axis(index_data.index.to_timestamp())
 
     with col1:
         # Show all box plots together for a visual comparison
@@ -246,7 +203,7 @@ elif page == page3:
         ax_all_box.set_ylabel('Indicator Value', fontsize=8)
         ax_all_box.grid(True)
 
-        st.pyplot(fig_all_box)
+        show_figure(plt, fig_all_box, view)
 
         st.write("**DTPI Indicator for EU27**") 
         fig_index, ax_index = plt.subplots(figsize=(5, 4))  # Adjust figure size
@@ -257,7 +214,7 @@ elif page == page3:
         ax_index.grid(True)  # Add grid to the plot
         ax_index.tick_params(axis='x', rotation=45, labelsize=9)
         ax_index.tick_params(axis='y', labelsize=9)
-        st.pyplot(fig_index)
+        show_figure(plt, fig_index, view)
 
     with col2:
         # Show all box plots together for a visual comparison
@@ -269,7 +226,7 @@ elif page == page3:
         ax_all_box.set_ylabel('Indicator Value', fontsize=8)
         ax_all_box.grid(True)
 
-        st.pyplot(fig_all_box)
+        show_figure(plt, fig_all_box, view)
 
         st.write(f"**DTPI Indicator for selected countries**") 
         fig_index, ax_index = plt.subplots(figsize=(5, 4))  # Adjust figure size
@@ -282,7 +239,7 @@ elif page == page3:
             ax_index.tick_params(axis='x', rotation=45, labelsize=9)
             ax_index.tick_params(axis='y', labelsize=9)
             ax_index.legend()
-        st.pyplot(fig_index)
+        show_figure(plt, fig_index, view)
 
     index_data_filtered = index_data[['EU27_2020'] + options]
     index_data_filtered.rename(columns={'quarter': 'Quarter'}, inplace=True)
@@ -319,6 +276,18 @@ elif page == page4:
      st.info("Datasets are refreshed quarterly at the source", icon="📬")
      st.title("Zooming into the EU27 and EU6 components of the DTPI")
 
+     import numpy as np
+     import pandas as pd
+     import plotly.express as px
+
+     from session_view import SessionView, get_shared_data
+
+     plt = import_pyplot()
+     dtpi_table = load_dtpi_table()
+
+     # The data is shared by the sessions of the process, the session only holds its projections
+     view = SessionView(*get_shared_data(dtpi_table), st.session_state)
+
      # Tab 0 is for the Overview, the rest is for selected countries
      tabs = st.tabs([f'{title}' for title in country_titles])
      tab_idx = 0
@@ -326,50 +295,57 @@ elif page == page4:
          
          with tabs[tab_idx]:
              
+             if not view.within_budget():
+                 # Each country renders five figures: the run stops rendering once the session spent its budget
+                 st.warning(f'{country_titles[idx]} is not shown: too much is being rendered at once, please reload the page', icon="⚠️")
+                 tab_idx += 1
+                 continue
+
              st.markdown(f'### Data for **{country_titles[idx]}**: you can scroll and zoom into the details for the different views')
              
+             # Projection of this country, kept by the session for the next reruns
+             country_data = view.country_frame(country)
+
              col1, col2 = st.columns([1,2])
-             if isinstance(transformed_data.index, pd.PeriodIndex):
-                    transformed_data.index = transformed_data.index.to_timestamp()
-            
-             if isinstance(index_data.index, pd.PeriodIndex):
-                    index_data.index = index_data.index.to_timestamp()
 
             # Column 1 content: ICT Employment, GVA, and Labour Demand Data
              with col1:
                 st.write("**ICT Employment Data**")
                 # Ensure the index is only converted if it's a PeriodIndex
                 fig1, ax1 = plt.subplots(figsize=(4, 2.5))  # Adjust figure size
-                ax1.plot(transformed_data.index, transformed_data[f'{country}_employment_value'], marker='o', color='orange')
+                employment = country_data['value', 'employment']
+                ax1.plot(employment.index, employment, marker='o', color='orange')
                 ax1.set_title(f'ICT Employment Data for {country}', fontsize=12)
                 ax1.set_xlabel('Quarter', fontsize=10)
                 ax1.set_ylabel('Percentage of Total Employees', fontsize=10)
                 ax1.grid(True)  # Add grid to the plot
                 ax1.tick_params(axis='x', rotation=45, labelsize=9)
                 ax1.tick_params(axis='y', labelsize=9)
-                st.pyplot(fig1)
+                show_figure(plt, fig1, view)
 
                 st.write("**Labour Demand Data**")
                 fig3, ax3 = plt.subplots(figsize=(4, 2.5))  # Adjust figure size
-                ax3.plot(transformed_data.index, transformed_data[f'{country}_labour_demand_value'], marker='o', color='orange')
+                labour_demand = country_data['value', 'labour_demand']
+                ax3.plot(labour_demand.index, labour_demand, marker='o', color='orange')
                 ax3.set_title(f'Labour Demand Data for {country}', fontsize=12)
                 ax3.set_xlabel('Quarter', fontsize=10)
                 ax3.set_ylabel('Percentage of Total Job Advertisements Online', fontsize=9)
                 ax3.grid(True)  # Add grid to the plot
                 ax3.tick_params(axis='x', rotation=45, labelsize=9)
                 ax3.tick_params(axis='y', labelsize=9)
-                st.pyplot(fig3)
+                show_figure(plt, fig3, view)
 
                 st.write("**GVA Data**")
                 fig2, ax2 = plt.subplots(figsize=(4, 2.5))  # Adjust figure size
-                ax2.plot(transformed_data.index, transformed_data[f'{country}_GVA_value'], marker='o', color='yellow')
+                GVA = country_data['value', 'GVA']
+                ax2.plot(GVA.index, GVA, marker='o', color='yellow')
                 ax2.set_title(f'GVA Data for {country}', fontsize=12)
                 ax2.set_xlabel('Quarter', fontsize=10)
                 ax2.set_ylabel('Percentage of GDP', fontsize=10)
                 ax2.grid(True)  # Add grid to the plot  
                 ax2.tick_params(axis='x', rotation=45, labelsize=9)
                 ax2.tick_params(axis='y', labelsize=9)
-                st.pyplot(fig2)
+                show_figure(plt, fig2, view)
                 tab_idx += 1
             # Column 2 content: Index plot and bubble chart
              with col2:
@@ -380,25 +356,25 @@ elif page == page4:
                 dpi_fig = 200
 
                 fig_index, ax_index = plt.subplots(figsize=(plot_width/dpi_fig, 2.5), dpi = dpi_fig)  # Adjust figure size
-                ax_index.plot(index_data.index, index_data[f'{country}'], marker='x', label=f'{country}', color='red')
+                index_series = country_data['index', 'DTPI']
+                ax_index.plot(index_series.index, index_series, marker='x', label=f'{country}', color='red')
                 ax_index.set_title(f'Indicator for {country}', fontsize=12)
                 ax_index.set_xlabel('Quarter', fontsize=10)
                 ax_index.set_ylabel('Indicator Value', fontsize=10)
                 ax_index.grid(True)  # Add grid to the plot
                 ax_index.tick_params(axis='x', rotation=45, labelsize=9)
                 ax_index.tick_params(axis='y', labelsize=9)
-                st.pyplot(fig_index)
+                show_figure(plt, fig_index, view)
                 
-                def plot_heatmap_plotly(transformed_data, index_data, country):
+                def plot_heatmap_plotly(country_data, country):
                     # Prepare data for the heatmap (GVA, Employment, Labour Demand)
-                    heatmap_data = transformed_data[[f'{country}_GVA_normalized_moving_average_value', 
-                                                    f'{country}_employment_normalized_moving_average_value', 
-                                                    f'{country}_labour_demand_normalized_moving_average_value']]
+                    # A copy: the projection is kept by the session for the next reruns
+                    heatmap_data = country_data['normalized'].copy()
                     heatmap_data.columns = ['GVA', 'Employment', 'Labour Demand']
                     heatmap_data[' '] = np.nan  # nan column to create a space in the heatmap
 
                     # Add the index data as a new row to the heatmap
-                    index_row = pd.DataFrame(index_data[f'{country}']).T
+                    index_row = pd.DataFrame(country_data['index', 'DTPI'].rename(country)).T
                     #index_row.index = ['Index']
 
                     # Combine the original heatmap data with the index data
@@ -421,8 +397,10 @@ elif page == page4:
                                     font=dict(color='#e5e5e5')  # Font color
                     )
                                     
+                    # The chart is sent as JSON, built in the memory of the server by the run
+                    view.charge(len(fig.to_json()), 'chart')
                     st.plotly_chart(fig)
-                plot_heatmap_plotly(transformed_data, index_data, f'{country}')
+                plot_heatmap_plotly(country_data, f'{country}')
              
             #  st.markdown(f'---')
              st.markdown(f'### Historical Analysis and Highlights for {country_titles[idx]} DPTI Indicator')
@@ -451,3 +429,4 @@ elif page == page4:
                         st.markdown(f'<details><summary>{year} {quarter}</summary>{highlights_per_year_quarter[year][quarter]}</details>', unsafe_allow_html=True, help=None)
              except KeyError:
                  error_print(f'{country} data is not available: no rendering')
+
@@ -0,0 +1,304 @@
+import os
+import fcntl
+import shutil
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from utils import debug_print, info_print, error_print
+
+# Default folder for the on-node caches: every Streamlit process on the same host points here
+default_cache_dir = os.getenv('DTPI_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'dtpi_cache'))
+
+
+class FileLock:
+    '''
+    Exclusive lock backed by a file on the local disk, so that it works across processes.
+
+    It is meant to be used as a context manager around the refresh of a cache entry: only one
+    process performs the (slow) refresh, while the others block and then read what has been stored.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+class MemoryCacheBackend:
+    '''
+    Keep the cached frames in the memory of the current process (one copy per replica).
+    '''
+    name = 'memory'
+
+    def __init__(self, cache_dir=default_cache_dir):
+        self.cache_dir = cache_dir
+        self._frames = {}
+
+    def load(self, key):
+        return self._frames.get(key)
+
+    def store(self, key, frames):
+        self._frames[key] = frames
+
+    def invalidate(self, key):
+        self._frames.pop(key, None)
+
+
+class DiskCacheBackend:
+    '''
+    Keep the cached frames pickled on the local disk: the download is shared across the processes,
+    but each process still deserialises its own copy in memory.
+    '''
+    name = 'disk'
+
+    def __init__(self, cache_dir=default_cache_dir):
+        self.cache_dir = cache_dir
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def load(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def store(self, key, frames):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        # Write aside and then rename, readers never see a partially written file
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as f:
+            pickle.dump(frames, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, path)
+
+    def invalidate(self, key):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class ArrowCacheBackend:
+    '''
+    Keep the cached frames as uncompressed Arrow IPC (Feather v2) files, opened memory-mapped.
+
+    All the processes on the node map the same immutable files, so the page cache holds a single
+    copy of the data. Float columns are written without nulls (NaN stays NaN) so that pandas can
+    wrap the mapped buffers zero-copy; string columns are dictionary encoded.
+
+    The frames of a key are written together in a new folder (a version), and the key, a symbolic
+    link, is then switched to it at once: a reader sees either all the previous frames or all the
+    new ones, never a mix nor a partial set. The previous version is kept for the readers still
+    listing it, the older ones are removed (the processes which mapped their files keep on reading
+    them until they unmap them). A process drops its mappings of a key's other versions as soon as
+    it opens the current one, so that the files removed are unmapped and their space freed.
+    '''
+    name = 'arrow'
+
+    def __init__(self, cache_dir=default_cache_dir):
+        self.cache_dir = cache_dir
+        # Mapped tables by path, along with the inode they were opened from
+        self._tables = {}
+        # The sessions of the process open the tables concurrently
+        self._lock = threading.Lock()
+
+    def _folder(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _version(self, key):
+        '''
+        Return the folder of the current version of key, None when there is none.
+        '''
+        folder = self._folder(key)
+        if not os.path.isdir(folder):
+            return None
+        # Resolved once, so that all the frames are read from the same version
+        return os.path.realpath(folder)
+
+    def _open_table(self, path):
+        inode = os.stat(path).st_ino
+        if path in self._tables and self._tables[path][0] == inode:
+            return self._tables[path][1]
+        source = pa.memory_map(path, 'r')
+        table = pa.ipc.open_file(source).read_all()
+        self._tables[path] = (inode, table)
+        return table
+
+    def _prune(self, key, version=None):
+        '''
+        Drop the mappings of the versions of key other than the given one (all by default): once
+        no longer referenced, their files are unmapped.
+        '''
+        for path in list(self._tables):
+            folder = os.path.dirname(path)
+            name = os.path.basename(folder)
+            if folder != version and (name == key or name.startswith(f'{key}.')):
+                debug_print(f'Unmapping {path}')
+                del self._tables[path]
+
+    def open_table(self, key, frame_name):
+        '''
+        Open the Arrow table memory-mapped: nothing is read until the buffers are touched.
+
+        The mapping is reused as long as the file on disk is the same one (same inode), a file
+        replaced by a refresh is mapped again.
+        '''
+        version = self._version(key)
+        with self._lock:
+            self._prune(key, version)
+            return self._open_table(os.path.join(version, f'{frame_name}.arrow'))
+
+    def open_tables(self, key):
+        '''
+        Open all the Arrow tables stored under key memory-mapped, without converting them to pandas.
+        '''
+        version = self._version(key)
+        if version is None:
+            return None
+        tables = {}
+        with self._lock:
+            self._prune(key, version)
+            try:
+                for file in sorted(os.listdir(version)):
+                    if file.endswith('.arrow'):
+                        tables[file[:-len('.arrow')]] = self._open_table(os.path.join(version, file))
+            except FileNotFoundError:
+                # The version has been removed meanwhile (invalidated): a miss
+                return None
+        return tables or None
+
+    def load(self, key):
+        tables = self.open_tables(key)
+        if tables is None:
+            return None
+        return {frame_name: read_frame(table) for frame_name, table in tables.items()}
+
+    def store(self, key, frames):
+        '''
+        Store the frames, given as DataFrames or as Arrow tables (whose record batches are kept).
+        '''
+        os.makedirs(self.cache_dir, exist_ok=True)
+        folder = self._folder(key)
+        previous = self._version(key)
+
+        version = tempfile.mkdtemp(prefix=f'{key}.', dir=self.cache_dir)
+        try:
+            for frame_name, frame in frames.items():
+                table = frame if isinstance(frame, pa.Table) else to_arrow_table(frame)
+                feather.write_feather(table, os.path.join(version, f'{frame_name}.arrow'), compression='uncompressed')
+        except Exception:
+            # The current version stays in place, untouched
+            shutil.rmtree(version, ignore_errors=True)
+            raise
+
+        if os.path.isdir(folder) and not os.path.islink(folder):
+            # Folder written by a previous release, without versions
+            shutil.rmtree(folder)
+        link = f'{version}.link'
+        os.symlink(os.path.basename(version), link)
+        os.replace(link, folder)
+
+        self._remove_versions(key, keep=(version, previous))
+
+    def _remove_versions(self, key, keep=()):
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(f'{key}.') and os.path.isdir(path) and not os.path.islink(path) and path not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def invalidate(self, key):
+        folder = self._folder(key)
+        # Removing the link is atomic, the versions are removed afterwards
+        if os.path.islink(folder):
+            os.remove(folder)
+        elif os.path.isdir(folder):
+            shutil.rmtree(folder)
+        if os.path.isdir(self.cache_dir):
+            self._remove_versions(key)
+        with self._lock:
+            self._prune(key)
+
+
+def to_arrow_table(frame):
+    '''
+    Convert a DataFrame into an Arrow table suitable to be mapped zero-copy.
+    '''
+    frame = frame.copy()
+    for column in frame.columns:
+        if pd.api.types.is_string_dtype(frame[column].dtype):
+            frame[column] = frame[column].astype('category')
+    table = pa.Table.from_pandas(frame, preserve_index=True)
+    for idx, column in enumerate(table.column_names):
+        if column in frame.columns and pd.api.types.is_float_dtype(frame[column].dtype):
+            # from_pandas turns NaN into nulls, which would force a copy when reading back
+            values = pa.array(frame[column].to_numpy(dtype=np.float64), from_pandas=False)
+            table = table.set_column(idx, column, values)
+    return table
+
+
+cache_backends = {
+    MemoryCacheBackend.name: MemoryCacheBackend,
+    DiskCacheBackend.name: DiskCacheBackend,
+    ArrowCacheBackend.name: ArrowCacheBackend,
+}
+
+
+def get_cache_backend(name='memory', cache_dir=default_cache_dir):
+    '''
+    Instantiate the cache backend given its name: memory, disk or arrow.
+    '''
+    if name not in cache_backends:
+        error_print(f'unknown cache backend {name}: falling back to memory')
+        name = MemoryCacheBackend.name
+    info_print(f'Using the {name} cache backend')
+    return cache_backends[name](cache_dir)
+
+
+def read_frame(table):
+    '''
+    Convert a (memory-mapped) Arrow table into a DataFrame, wrapping the mapped buffers zero-copy
+    where possible.
+    '''
+    return table.to_pandas(split_blocks=True)
+
+
+def get_or_refresh(backend, key, refresh, load=None):
+    '''
+    Return the frames cached under key, calling refresh() to build them when missing.
+
+    The refresh is guarded by a file lock: when several processes start cold at the same time,
+    only one downloads and processes the data, the others wait and then read the stored frames.
+    A custom load function can be given to read the entry differently, e.g. as mapped tables.
+    '''
+    load = load or backend.load
+    frames = load(key)
+    if frames is not None:
+        debug_print(f'Cache hit for {key} ({backend.name})')
+        return frames
+
+    with FileLock(os.path.join(backend.cache_dir, f'{key}.lock')):
+        # Another process may have refreshed the entry while waiting for the lock
+        frames = load(key)
+        if frames is None:
+            info_print(f'Cache miss for {key} ({backend.name}): refreshing')
+            frames = refresh()
+            backend.store(key, frames)
+            # Read back what has been stored, so that all the processes share the same copy
+            frames = load(key)
+
+    return frames
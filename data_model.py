@@ -0,0 +1,285 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Vocabularies of the data model: adding a measure or a stage means extending these tuples,
+# the data grows along an axis instead of widening a frame with new column names
+MEASURES = ('GVA', 'employment', 'labour_demand')
+STAGES = ('value', 'moving_average', 'normalized')
+
+# Name used for the DTPI rows in the long representation
+INDEX_MEASURE = 'DTPI'
+INDEX_STAGE = 'index'
+
+# Columns of the long (tidy) representation
+LONG_COLUMNS = ['geo', 'quarter', 'measure', 'stage', 'value']
+
+
+class DTPIData:
+    '''
+    Canonical representation of the processed data, indexed by (geo, quarter, measure, stage).
+
+    Values are held in an integer-coded cube of shape (geos, measures, stages, quarters), so that
+    selecting the series for a geo, a measure and a stage is an O(1) slice of the cube, returned
+    as a view. The DTPI is held aside, in a (geos, quarters) array.
+    Instances are immutable: the arrays are flagged as read-only and shared across the sessions.
+    '''
+    def __init__(self, geos, quarters, values, index=None):
+        self.geos = tuple(geos)
+        self.quarters = pd.Index(quarters, name='quarter')
+        self.values = values
+        self.values.flags.writeable = False
+        self.index = index
+        self.has_index = index is not None
+        if self.index is not None:
+            self.index.flags.writeable = False
+
+        self._geo_codes = {geo: code for code, geo in enumerate(self.geos)}
+
+    def _code(self, vocabulary, codes, name, what):
+        if name not in codes:
+            raise KeyError(f'unknown {what} {name}, expected one of {vocabulary}')
+        return codes[name]
+
+    def geo_code(self, geo):
+        return self._code(self.geos, self._geo_codes, geo, 'geo')
+
+    def geo_values(self, geo):
+        '''
+        Return the (measures, stages, quarters) values of a geo, as a read-only view.
+        '''
+        return self.values[self.geo_code(geo)]
+
+    def geo_index(self, geo):
+        '''
+        Return the DTPI values of a geo, as a read-only view.
+        '''
+        return self.index[self.geo_code(geo)]
+
+    def series(self, geo, measure, stage='value'):
+        '''
+        Return the series of a measure, at the given stage of the processing, for a geo.
+        '''
+        values = self.geo_values(geo)
+        m = self._code(MEASURES, _measure_codes, measure, 'measure')
+        s = self._code(STAGES, _stage_codes, stage, 'stage')
+        return pd.Series(values[m, s], index=self.quarters, name=measure)
+
+    def frame(self, geo, stage='value'):
+        '''
+        Return all the measures of a geo, at the given stage, as a DataFrame (one column per measure).
+        '''
+        values = self.geo_values(geo)
+        s = self._code(STAGES, _stage_codes, stage, 'stage')
+        return pd.DataFrame(values[:, s].T, index=self.quarters, columns=list(MEASURES))
+
+    def index_series(self, geo):
+        '''
+        Return the DTPI series for a geo.
+        '''
+        return pd.Series(self.geo_index(geo), index=self.quarters, name=geo)
+
+    def index_frame(self, geos=None):
+        '''
+        Return the DTPI of the given geos (all by default) as a DataFrame (one column per geo).
+        '''
+        geos = list(self.geos) if geos is None else list(geos)
+        index = np.stack([self.geo_index(geo) for geo in geos], axis=1) if geos else np.empty((len(self.quarters), 0))
+        return pd.DataFrame(index, index=self.quarters, columns=geos)
+
+    def select(self, geos):
+        '''
+        Return the data restricted to the given geos (a copy of their values).
+        '''
+        values = np.stack([self.geo_values(geo) for geo in geos])
+        index = np.stack([self.geo_index(geo) for geo in geos]) if self.has_index else None
+        return DTPIData(geos, self.quarters, values, index)
+
+    def with_index(self, index):
+        '''
+        Return the same data along with the given DTPI values.
+        '''
+        return DTPIData(self.geos, self.quarters, self.values, index)
+
+    def to_long(self):
+        '''
+        Return the long (tidy) representation, indexed by (geo, quarter, measure, stage).
+        '''
+        G, M, S, Q = self.values.shape
+        frames = [pd.DataFrame({
+            'geo': np.repeat(self.geos, M * S * Q),
+            'measure': np.tile(np.repeat(MEASURES, S * Q), G),
+            'stage': np.tile(np.repeat(STAGES, Q), G * M),
+            'quarter': np.tile(self.quarters, G * M * S),
+            'value': self.values.reshape(-1),
+        })]
+        if self.index is not None:
+            frames.append(pd.DataFrame({
+                'geo': np.repeat(self.geos, Q),
+                'measure': INDEX_MEASURE,
+                'stage': INDEX_STAGE,
+                'quarter': np.tile(self.quarters, G),
+                'value': self.index.reshape(-1),
+            }))
+        long_data = pd.concat(frames, ignore_index=True)[LONG_COLUMNS]
+
+        return long_data.set_index(LONG_COLUMNS[:-1])
+
+    @classmethod
+    def from_long(cls, long_data):
+        '''
+        Build the data from its long (tidy) representation.
+        '''
+        if isinstance(long_data.index, pd.MultiIndex):
+            long_data = long_data.reset_index()
+        geos = list(pd.unique(long_data['geo']))
+        quarters = sorted(pd.unique(long_data['quarter']))
+
+        is_index = (long_data['measure'] == INDEX_MEASURE).to_numpy()
+        g = pd.Categorical(long_data['geo'], categories=geos).codes
+        q = pd.Categorical(long_data['quarter'], categories=quarters).codes
+        # The DTPI rows are not part of the vocabularies of the measures and stages
+        labels = long_data.loc[~is_index]
+        for column, vocabulary in (('measure', MEASURES), ('stage', STAGES)):
+            # Out of the vocabulary, a label would be coded -1 and fill the last slot
+            unknown = ~labels[column].isin(vocabulary)
+            if unknown.any():
+                raise KeyError(f'unknown {column} {sorted(set(labels.loc[unknown, column].astype(str)))}, expected one of {vocabulary}')
+        m = pd.Categorical(labels['measure'], categories=MEASURES).codes
+        s = pd.Categorical(labels['stage'], categories=STAGES).codes
+        value = long_data['value'].to_numpy(dtype=np.float64)
+
+        values = np.full((len(geos), len(MEASURES), len(STAGES), len(quarters)), np.nan)
+        values[g[~is_index], m, s, q[~is_index]] = value[~is_index]
+        index = None
+        if is_index.any():
+            index = np.full((len(geos), len(quarters)), np.nan)
+            index[g[is_index], q[is_index]] = value[is_index]
+
+        return cls(geos, quarters, values, index)
+
+    def to_arrow(self):
+        '''
+        Return the long representation as an Arrow table made of one record batch per geo, so that
+        the data of a geo can be read alone from a memory-mapped file.
+
+        The rows of a batch are laid out as the cube: the values by (measure, stage, quarter), then
+        the DTPI by quarter. The labels are dictionary encoded (small integer codes over the
+        vocabularies), the values are kept as float64 without nulls, so that the values of a geo
+        can be wrapped zero-copy, see MappedDTPIData.
+        '''
+        G, M, S, Q = self.values.shape
+        dictionaries = {
+            'geo': (pa.int16(), list(self.geos)),
+            'quarter': (pa.int16(), [str(quarter) for quarter in self.quarters]),
+            'measure': (pa.int8(), list(MEASURES) + [INDEX_MEASURE]),
+            'stage': (pa.int8(), list(STAGES) + [INDEX_STAGE]),
+        }
+        fields = [pa.field(column, pa.dictionary(index_type, pa.string())) for column, (index_type, _) in dictionaries.items()]
+        schema = pa.schema(fields + [pa.field('value', pa.float64())],
+                           metadata={'dtpi.layout': 'geo/measure/stage/quarter',
+                                     'dtpi.index': 'true' if self.index is not None else 'false'})
+
+        # Codes of the rows of a geo, the geo aside
+        codes = {
+            'quarter': np.tile(np.arange(Q), M * S),
+            'measure': np.repeat(np.arange(M), S * Q),
+            'stage': np.tile(np.repeat(np.arange(S), Q), M),
+        }
+        if self.index is not None:
+            codes = {
+                'quarter': np.concatenate([codes['quarter'], np.arange(Q)]),
+                'measure': np.concatenate([codes['measure'], np.full(Q, M)]),
+                'stage': np.concatenate([codes['stage'], np.full(Q, S)]),
+            }
+        rows = len(codes['quarter'])
+
+        def labels(column, column_codes):
+            index_type, dictionary = dictionaries[column]
+            return pa.DictionaryArray.from_arrays(pa.array(column_codes, type=index_type), pa.array(dictionary, pa.string()))
+
+        batches = []
+        for g in range(G):
+            value = self.values[g].reshape(-1)
+            if self.index is not None:
+                value = np.concatenate([value, self.index[g]])
+            batches.append(pa.RecordBatch.from_arrays(
+                [labels('geo', np.full(rows, g))] + [labels(column, codes[column]) for column in ('quarter', 'measure', 'stage')] +
+                # NaN are kept as such, not as nulls, to read the values back zero-copy
+                [pa.array(value.astype(np.float64), from_pandas=False)],
+                schema=schema))
+
+        return pa.Table.from_batches(batches, schema=schema)
+
+    @classmethod
+    def from_arrow(cls, table, geos=None):
+        '''
+        Build the data from an Arrow table written by to_arrow, reading (copying) only the batches
+        of the given geos (all by default).
+        '''
+        batches = table.to_batches()
+        if geos is not None:
+            geos = set(geos)
+            batches = [batch for batch in batches if batch.num_rows and batch.column(0)[0].as_py() in geos]
+        long_data = pa.Table.from_batches(batches, schema=table.schema).to_pandas()
+        # Tables written by previous releases hold plain strings, the current ones categories
+        long_data[LONG_COLUMNS[:-1]] = long_data[LONG_COLUMNS[:-1]].astype(str)
+
+        return cls.from_long(long_data)
+
+    @classmethod
+    def map_arrow(cls, table):
+        '''
+        Return the data over an Arrow table written by to_arrow, without reading it: see
+        MappedDTPIData. A table written by a previous release, with another layout, is read (copied)
+        at once instead.
+        '''
+        metadata = table.schema.metadata or {}
+        if metadata.get(b'dtpi.layout') != b'geo/measure/stage/quarter':
+            return cls.from_arrow(table)
+        return MappedDTPIData(table)
+
+
+class MappedDTPIData(DTPIData):
+    '''
+    Data over an Arrow table written by DTPIData.to_arrow, usually memory-mapped (see
+    data_cache.ArrowCacheBackend), which is never copied: the values of a geo are a read-only view
+    over the value buffer of its record batch. Only the pages of the geos selected are read, and
+    shared with the other processes of the node mapping the same file.
+
+    The whole cube (values, index) is only built, as a copy, when asked for, e.g. by to_long.
+    '''
+    def __init__(self, table):
+        self.table = table
+        self._batches = {batch.column(0)[0].as_py(): batch for batch in table.to_batches() if batch.num_rows}
+        self.geos = tuple(self._batches)
+        self.quarters = pd.Index(table.column('quarter').chunk(0).dictionary.to_pylist(), name='quarter')
+        self.has_index = table.schema.metadata.get(b'dtpi.index') == b'true'
+
+        self._geo_codes = {geo: code for code, geo in enumerate(self.geos)}
+        self._size = len(MEASURES) * len(STAGES) * len(self.quarters)
+
+    def _geo_buffer(self, geo):
+        self.geo_code(geo)
+        # Zero-copy: it raises rather than copying, e.g. if the values held nulls
+        return self._batches[geo].column(4).to_numpy(zero_copy_only=True)
+
+    def geo_values(self, geo):
+        return self._geo_buffer(geo)[:self._size].reshape(len(MEASURES), len(STAGES), len(self.quarters))
+
+    def geo_index(self, geo):
+        if not self.has_index:
+            raise KeyError(f'no DTPI in the data of {geo}')
+        return self._geo_buffer(geo)[self._size:]
+
+    @property
+    def values(self):
+        return np.stack([self.geo_values(geo) for geo in self.geos])
+
+    @property
+    def index(self):
+        return np.stack([self.geo_index(geo) for geo in self.geos]) if self.has_index else None
+
+
+_measure_codes = {measure: code for code, measure in enumerate(MEASURES)}
+_stage_codes = {stage: code for code, stage in enumerate(STAGES)}
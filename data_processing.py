@@ -1,5 +1,12 @@
+import warnings
+
+import numpy as np
 import pandas as pd
 
+import settings
+
+from data_model import DTPIData, MEASURES, STAGES
+
 def rename_geo_cols(input_df):
     # Rename the column since it only contains geographic information
     if 'geo\\TIME_PERIOD' in input_df.columns:
@@ -27,3 +34,104 @@ def process_ICT_labour_import_data(input_df, date):
 
     return output
 
+# Criteria to select, for each measure, the series used by the DTPI out of the Eurostat datasets
+series_filters = {
+    # Sector 'J', unit 'PC_GDP', item 'B1G', and data not seasonally adjusted
+    'GVA': {'nace_r2': 'J', 'unit': 'PC_GDP', 'na_item': 'B1G', 's_adj': 'NSA'},
+    # Sector 'J', unit 'PC_TOT_PER', item 'EMP_DC', and data not seasonally adjusted
+    'employment': {'nace_r2': 'J', 'unit': 'PC_TOT_PER', 'na_item': 'EMP_DC', 's_adj': 'NSA'},
+    # Percentage of the online job advertisements
+    'labour_demand': {'unit': 'PC'},
+}
+
+def filter_series(GVA_data, Employment_data, Labour_demand_ICT_data, countries=None):
+    '''
+    Select, for the given countries (all by default), the series of each measure out of the
+    processed Eurostat data.
+
+    It returns a long DataFrame with the columns geo, measure, quarter and value.
+    '''
+    datasets = {'GVA': GVA_data, 'employment': Employment_data, 'labour_demand': Labour_demand_ICT_data}
+
+    filtered_data_list = []
+    for measure in MEASURES:
+        dataset = datasets[measure]
+        mask = dataset['geo'].notna() if countries is None else dataset['geo'].isin(countries)
+        for column, value in series_filters[measure].items():
+            mask &= dataset[column] == value
+        filtered_data = dataset.loc[mask, ['geo', 'quarter', 'value']].copy()
+        filtered_data['geo'] = filtered_data['geo'].astype(str)
+        filtered_data['measure'] = measure
+        filtered_data_list.append(filtered_data)
+
+    return pd.concat(filtered_data_list, ignore_index=True)[['geo', 'measure', 'quarter', 'value']]
+
+def min_max_scale(values):
+    '''
+    Scale each column of values to the [0, 1] range, ignoring NaN. Constant columns are scaled
+    to 0, as sklearn's MinMaxScaler does.
+    '''
+    with warnings.catch_warnings():
+        # All-NaN columns stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        minimum = np.nanmin(values, axis=0)
+        value_range = np.nanmax(values, axis=0) - minimum
+    value_range[value_range == 0] = 1
+
+    return (values - minimum)/value_range
+
+def transform_data(series_data, countries, window):
+    '''
+    Compute, for each country and measure, the moving average over the given window and its
+    min-max normalisation, out of the series selected by filter_series.
+
+    Only the quarters available for all the series are kept (inner join), as well as only the
+    quarters where all the values could be computed.
+    '''
+    series_data = series_data.drop_duplicates(['quarter', 'geo', 'measure'])
+
+    # Keep the quarters for which all the series are available
+    available = series_data.groupby('quarter').size()
+    common_quarters = available.index[available == len(countries) * len(MEASURES)]
+
+    # One column per (country, measure), one row per quarter
+    raw_data = series_data.set_index(['quarter', 'geo', 'measure'])['value'].unstack(['geo', 'measure'])
+    raw_data = raw_data.reindex(index=common_quarters.sort_values(),
+                                columns=pd.MultiIndex.from_product([countries, MEASURES]))
+
+    # Calculate the moving average of all the series at once
+    moving_average = raw_data.rolling(window=window).mean()
+
+    # Normalize the moving average using Min-Max scaling, series by series (NaN are ignored)
+    normalized_moving_average = min_max_scale(moving_average.to_numpy())
+
+    # Arrange the stages into the (geo, measure, stage, quarter) cube
+    stages = np.stack([raw_data.to_numpy(), moving_average.to_numpy(), normalized_moving_average], axis=-1)
+    values = stages.reshape(len(raw_data.index), len(countries), len(MEASURES), len(STAGES)).transpose(1, 2, 3, 0)
+
+    # Drop the quarters where any of the values is missing
+    complete = ~np.isnan(values).any(axis=(0, 1, 2))
+    quarters = raw_data.index[complete].strftime('%y-Q%q')
+
+    return DTPIData(countries, quarters, np.ascontiguousarray(values[..., complete]))
+
+def compute_index_data(data, w1=1, w2=1, w3=1):
+    '''
+    Compute the DTPI for each country as the weighted average of the normalised measures:
+    w1 - GVA, w2 - Employment, w3 - Labour Demand.
+    '''
+    weights = np.array([w1, w2, w3], dtype=np.float64)
+    normalized = data.values[:, :, STAGES.index('normalized'), :]
+
+    # Calculate the index as the weighted sum of normalized values
+    index = np.tensordot(weights, normalized, axes=([0], [1]))/weights.sum()
+
+    return data.with_index(index)
+
+def build_dtpi_data(frames, countries=settings.countries, window=settings.window, weights=settings.weights):
+    '''
+    Build the processed data out of the Eurostat frames (by measure), as returned by a data source.
+    '''
+    series_data = filter_series(frames['GVA'], frames['employment'], frames['labour_demand'], countries)
+
+    return compute_index_data(transform_data(series_data, countries, window), *weights)
@@ -0,0 +1,120 @@
+import os
+
+import pandas as pd
+
+from data_cache import default_cache_dir
+from data_processing import process_import_data, process_ICT_labour_import_data
+from utils import debug_print, info_print, error_print
+
+# Eurostat datasets used for each measure
+eurostat_datasets = {
+    'GVA': 'namq_10_a10',
+    'employment': 'namq_10_a10_e',
+    'labour_demand': 'isoc_sk_oja1',
+}
+
+# Define the starting quarter for filtering data
+date_start = '2019Q4'
+
+
+def process_frames(raw_frames, date=date_start):
+    '''
+    Process the raw frames (by measure), in the Eurostat format, from the given starting quarter.
+    '''
+    return {
+        'GVA': process_import_data(raw_frames['GVA'], date),
+        'employment': process_import_data(raw_frames['employment'], date),
+        'labour_demand': process_ICT_labour_import_data(raw_frames['labour_demand'], date),
+    }
+
+
+class EurostatSource:
+    '''
+    Data source backed by the Eurostat API.
+    '''
+    name = 'eurostat'
+
+    def last_updated(self):
+        '''
+        Return the last update of each dataset, as published in the Eurostat table of contents.
+        '''
+        import eurostat
+
+        toc = eurostat.get_toc_df()
+        toc = toc[toc['code'].isin(eurostat_datasets.values())]
+        return {code: str(last_update) for code, last_update in zip(toc['code'], toc['last update of data'])}
+
+    def fetch(self):
+        '''
+        Download and process the datasets.
+        '''
+        import eurostat
+
+        raw_frames = {}
+        for measure, code in eurostat_datasets.items():
+            raw_frames[measure] = eurostat.get_data_df(code)
+            info_print(f'Got {measure} data')
+
+        return process_frames(raw_frames)
+
+
+class LocalSource:
+    '''
+    Data source backed by a local folder holding one CSV file per measure (GVA.csv, employment.csv
+    and labour_demand.csv) in the Eurostat format. It allows running without Eurostat, e.g. to test
+    the refresh: touching a file is seen as an update of the dataset.
+    '''
+    name = 'local'
+
+    def __init__(self, path):
+        self.path = path
+
+    def _path(self, measure):
+        return os.path.join(self.path, f'{measure}.csv')
+
+    def last_updated(self):
+        return {measure: str(os.stat(self._path(measure)).st_mtime_ns) for measure in eurostat_datasets}
+
+    def fetch(self):
+        raw_frames = {measure: pd.read_csv(self._path(measure)) for measure in eurostat_datasets}
+        debug_print(f'Loaded local data from {self.path}')
+
+        return process_frames(raw_frames)
+
+
+class ExcelSource:
+    '''
+    Data source backed by a curated workbook (e.g. data/Index_v2_loc.xlsx), one sheet per measure as
+    exported from Eurostat. The workbook is parsed once and cached as Parquet, see excel_ingest.py;
+    a change of its content is seen as an update of the datasets.
+    '''
+    name = 'excel'
+
+    def __init__(self, path, cache_dir=default_cache_dir):
+        self.path = path
+        self.cache_dir = cache_dir
+
+    def last_updated(self):
+        from excel_ingest import file_hash
+
+        return {'workbook': file_hash(self.path)}
+
+    def fetch(self):
+        from excel_ingest import load_workbook
+
+        return load_workbook(self.path, date_start, self.cache_dir)
+
+
+def get_data_source(spec='eurostat', cache_dir=default_cache_dir):
+    '''
+    Instantiate the data source given its specification: eurostat, local:<path to the folder> or
+    excel:<path to the workbook> (parsed into the given cache folder).
+    '''
+    if spec.startswith(f'{LocalSource.name}:'):
+        return LocalSource(spec[len(LocalSource.name) + 1:])
+    if spec.startswith(f'{ExcelSource.name}:'):
+        return ExcelSource(spec[len(ExcelSource.name) + 1:], cache_dir)
+    if spec != EurostatSource.name:
+        error_print(f'unknown data source {spec}: falling back to eurostat')
+
+    return EurostatSource()
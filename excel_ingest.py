@@ -0,0 +1,135 @@
+import os
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from data_cache import FileLock, default_cache_dir
+from data_processing import series_filters
+from utils import debug_print, info_print
+
+# Sheets of the curated workbook holding each measure
+workbook_sheets = {
+    'GVA': 'ICT_GVA_perc_of_total',
+    'employment': 'Employment_ICT',
+    'labour_demand': 'ICT_labor_demand',
+}
+
+# Eurostat exports label the geos by name, the app uses the codes
+geo_codes = {
+    'European Union - 27 countries (from 2020)': 'EU27_2020',
+    'Austria': 'AT', 'Belgium': 'BE', 'Bulgaria': 'BG', 'Croatia': 'HR', 'Cyprus': 'CY', 'Czechia': 'CZ',
+    'Denmark': 'DK', 'Estonia': 'EE', 'Finland': 'FI', 'France': 'FR', 'Germany': 'DE', 'Greece': 'EL',
+    'Hungary': 'HU', 'Iceland': 'IS', 'Ireland': 'IE', 'Italy': 'IT', 'Latvia': 'LV', 'Lithuania': 'LT',
+    'Luxembourg': 'LU', 'Malta': 'MT', 'Montenegro': 'ME', 'Netherlands': 'NL', 'North Macedonia': 'MK',
+    'Norway': 'NO', 'Poland': 'PL', 'Portugal': 'PT', 'Romania': 'RO', 'Serbia': 'RS', 'Slovakia': 'SK',
+    'Slovenia': 'SI', 'Spain': 'ES', 'Sweden': 'SE', 'Switzerland': 'CH', 'United Kingdom': 'UK',
+}
+
+# Version of the parsing (parse_sheet, read_workbook), part of the key of the cached Parquet files:
+# to be bumped whenever the parsed frames change, so that the workbooks are parsed again
+parser_version = 1
+
+# Columns produced by process_import_data and process_ICT_labour_import_data
+import_columns = ['unit', 'nace_r2', 's_adj', 'na_item', 'geo', 'value', 'quarter']
+labour_columns = ['unit', 'geo', 'time', 'value', 'quarter']
+
+
+def file_hash(path):
+    '''
+    Return the SHA-256 of the file content.
+    '''
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def parse_sheet(sheet, measure):
+    '''
+    Parse a sheet exported from Eurostat, as read with no header, into the schema produced by the
+    processing of the same measure downloaded from the API.
+
+    The table starts at the TIME row, with the quarters as columns and the geo labels, by name,
+    below the GEO (Labels) row; it ends at the first blank column and at the first blank row.
+    The sheet holds a single series per geo, so the dimensions are the ones selected by the DTPI
+    (see data_processing.series_filters).
+    '''
+    labels = sheet[1].astype(str).str.strip()
+    header_row = labels.index[labels == 'TIME'][0]
+
+    # Quarters, up to the first blank column
+    header = sheet.loc[header_row, 2:]
+    last_column = header.index[header.isna()][0] - 1 if header.isna().any() else header.index[-1]
+    quarters = header.loc[:last_column].astype(str).tolist()
+
+    # Geos, up to the first blank row (the row after TIME only holds the GEO (Labels) title)
+    rows = sheet.loc[header_row + 2:]
+    blank_rows = rows.index[rows[1].isna()]
+    rows = rows.loc[:blank_rows[0] - 1] if len(blank_rows) else rows
+
+    table = rows.loc[:, 2:last_column]
+    table.columns = quarters
+    table.insert(0, 'geo', rows[1].astype(str).str.strip().map(geo_codes))
+    unknown = rows.loc[table['geo'].isna(), 1].tolist()
+    if unknown:
+        debug_print(f'{measure}: skipping unknown geos {unknown}')
+    table = table[table['geo'].notna()]
+
+    melted = pd.melt(table, id_vars=['geo'], var_name='time', value_name='value')
+    # Eurostat marks the values not available as ':'
+    melted['value'] = pd.to_numeric(melted['value'].replace(':', np.nan), errors='coerce')
+    melted['quarter'] = pd.PeriodIndex(melted['time'], freq='Q')
+    for column, value in series_filters[measure].items():
+        melted[column] = value
+
+    if measure == 'labour_demand':
+        return melted[labour_columns]
+    return melted[import_columns]
+
+
+def read_workbook(path, date=None):
+    '''
+    Parse the curated workbook into the frames (by measure) a data source returns. It is slow
+    (openpyxl), see load_workbook for the cached version.
+    '''
+    info_print(f'Parsing {path}')
+    sheets = pd.read_excel(path, sheet_name=list(workbook_sheets.values()), header=None)
+
+    frames = {}
+    for measure, sheet_name in workbook_sheets.items():
+        frame = parse_sheet(sheets[sheet_name], measure)
+        if date is not None:
+            frame = frame[frame['quarter'] >= date]
+        frames[measure] = frame.reset_index(drop=True)
+    return frames
+
+
+def load_workbook(path, date=None, cache_dir=default_cache_dir):
+    '''
+    Load the curated workbook, parsing it only once: the frames are cached as Parquet files keyed
+    by the hash of the workbook and the version of the parser, so that the next runs skip the parse
+    until the workbook or the parser changes.
+    '''
+    folder = os.path.join(cache_dir, 'xlsx', f'{file_hash(path)}.v{parser_version}')
+
+    with FileLock(f'{folder}.lock'):
+        if not os.path.isdir(folder):
+            frames = read_workbook(path)
+            os.makedirs(f'{folder}.tmp', exist_ok=True)
+            for measure, frame in frames.items():
+                frame = frame.assign(quarter=frame['quarter'].astype(str))
+                frame.to_parquet(os.path.join(f'{folder}.tmp', f'{measure}.parquet'), index=False)
+            os.replace(f'{folder}.tmp', folder)
+        else:
+            debug_print(f'Workbook {path} already parsed, loading {folder}')
+
+    frames = {}
+    for measure in workbook_sheets:
+        frame = pd.read_parquet(os.path.join(folder, f'{measure}.parquet'))
+        frame['quarter'] = pd.PeriodIndex(frame['quarter'], freq='Q')
+        if date is not None:
+            frame = frame[frame['quarter'] >= date].reset_index(drop=True)
+        frames[measure] = frame
+    return frames
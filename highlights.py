@@ -0,0 +1,289 @@
+import os
+import json
+import hashlib
+import argparse
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import settings
+
+from data_cache import ArrowCacheBackend, default_cache_dir
+from data_model import DTPIData
+from utils import debug_print, info_print, error_print
+
+# Making sure to leverage upon absolute paths (avoid deployment issues)
+prt_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Prompt used to write the highlights, and where the drafts are written: not under docs/contents,
+# which is published as is (see text_to_print.py), the drafts are reviewed and moved there by hand
+prompt_path = os.path.join(prt_dir, 'docs', 'prompt')
+default_drafts_dir = os.path.join(prt_dir, 'docs', 'drafts')
+
+# Code used in the file names of the highlights, when different from the Eurostat one
+file_codes = {'EU27_2020': 'EU27'}
+
+# Columns of the table given to the model: the DTPI and its components, with their quarterly change
+context_columns = {'DTPI': 'DTPI', 'GVA': 'GVA', 'employment': 'Employment', 'labour_demand': 'Labour Demand'}
+
+
+def load_prompt(path=prompt_path):
+    '''
+    Load the prompt template.
+    '''
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def split_quarter(quarter):
+    '''
+    Split a quarter of the data (e.g. 23-Q4) into its year and quarter (2023, Q4).
+    '''
+    year, quarter = quarter.split('-')
+    return f'20{year}', quarter
+
+
+def quarter_context(data, geo, quarter):
+    '''
+    Assemble the data of a geo up to the given quarter: the DTPI and its (normalized) components,
+    along with their change with respect to the previous quarter.
+    '''
+    frame = data.frame(geo, 'normalized')
+    frame.insert(0, 'DTPI', data.index_series(geo))
+    frame = frame.loc[:quarter].rename(columns=context_columns)
+
+    context = pd.DataFrame(index=frame.index)
+    for column in frame.columns:
+        context[column] = frame[column]
+        context[f'{column} QoQ'] = frame[column].diff()
+
+    return context.round(4)
+
+
+def fill_prompt(template, geo, name, quarter, context):
+    '''
+    Fill the prompt template for a geo and a quarter, attaching the data as a Markdown table in
+    place of the image the template refers to.
+    '''
+    year, quarter = split_quarter(quarter)
+    prompt = (template.replace('[country code]', file_codes.get(geo, geo))
+                      .replace('[country name]', name)
+                      .replace('[quarter]', quarter)
+                      .replace('[year]', year))
+
+    return f'{prompt}\n\nThe data, by quarter, is:\n\n{context.to_markdown()}\n'
+
+
+def input_hash(backend, prompt):
+    '''
+    Return the hash of the inputs of a draft: the backend and the filled prompt (data included).
+    '''
+    return hashlib.sha256(f'{backend.key}\n{prompt}'.encode('utf-8')).hexdigest()
+
+
+class StubBackend:
+    '''
+    Backend writing the template with the figures only, without any model: it allows running
+    the pipeline end to end, and gives the reviewers the figures to start from.
+    '''
+    name = 'stub'
+    key = 'stub'
+
+    def load(self):
+        pass
+
+    def generate(self, prompt, geo, quarter, context):
+        year, quarter = split_quarter(quarter)
+        code = file_codes.get(geo, geo)
+        dtpi = context['DTPI']
+        change = context['DTPI QoQ'].iloc[-1]
+        trend = 'n/a' if np.isnan(change) else f'{change:+.4f}'
+        components = ', '.join(f'{column} {context[f"{column} QoQ"].iloc[-1]:+.4f}'
+                               for column in list(context_columns.values())[1:])
+
+        return '\n'.join([
+            f'**{code} {year} {quarter} Timeframe Analysis**',
+            '',
+            f'General remarks. The DTPI of {code} is {dtpi.iloc[-1]:.4f} in {year} {quarter} ({trend} on the previous quarter).',
+            '',
+            '**Quarterly Trend Analysis**',
+            '',
+            f'- **Time series analysis**.\n\n{context[["DTPI"]].to_markdown()}\n',
+            f'- **Quarter-over-quarter comparisons**. DTPI {trend}; components: {components}.',
+            '',
+            '**Variation Analysis**',
+            '',
+            f'- **Trend deviation**. {dtpi.iloc[-1] - dtpi.mean():+.4f} from the mean of the period ({dtpi.mean():.4f}).',
+            f'- **Range analysis**. From {dtpi.min():.4f} ({dtpi.idxmin()}) to {dtpi.max():.4f} ({dtpi.idxmax()}).',
+            '',
+            '**Potential Factors Influencing Trends**',
+            '',
+            '- **External factors**. [to be written]',
+            '- **Internal factors**. [to be written]',
+            '',
+        ])
+
+
+class T5Backend:
+    '''
+    Backend generating the drafts with a local T5 model (as in summariser.py), loaded once.
+    '''
+    name = 't5'
+
+    def __init__(self, model='t5-small', max_length=512):
+        self.model_name = model
+        self.key = f't5:{model}:{max_length}'
+        self.max_length = max_length
+        self._model = None
+        self._tokenizer = None
+
+    def load(self):
+        '''
+        Load the model, once: it is then shared by the workers.
+        '''
+        if self._model is None:
+            from transformers import T5ForConditionalGeneration, T5Tokenizer
+
+            info_print(f'Loading {self.model_name}')
+            self._tokenizer = T5Tokenizer.from_pretrained(self.model_name)
+            self._model = T5ForConditionalGeneration.from_pretrained(self.model_name)
+
+    def generate(self, prompt, geo, quarter, context):
+        inputs = self._tokenizer.encode(prompt, return_tensors='pt', max_length=self.max_length, truncation=True)
+        output_ids = self._model.generate(inputs, max_length=self.max_length, num_beams=4, early_stopping=True)
+
+        return self._tokenizer.decode(output_ids[0], skip_special_tokens=True)
+
+
+def get_backend(spec='stub'):
+    '''
+    Instantiate the backend given its specification: stub, t5 or t5:<model name>.
+    '''
+    if spec == T5Backend.name:
+        return T5Backend()
+    if spec.startswith(f'{T5Backend.name}:'):
+        return T5Backend(spec[len(T5Backend.name) + 1:])
+    if spec != StubBackend.name:
+        error_print(f'unknown backend {spec}: falling back to stub')
+
+    return StubBackend()
+
+
+class HighlightsPipeline:
+    '''
+    Generate the drafts of the highlights, for all the geos and quarters, from the prompt template.
+
+    The drafts are generated concurrently by the backend. The hash of the inputs of each draft is
+    recorded in the manifest of the drafts folder: a draft is regenerated only when its inputs
+    changed (e.g. a quarter revised by Eurostat, or a new quarter), or when its file is missing.
+    '''
+    def __init__(self, backend, drafts_dir=default_drafts_dir, template=None, max_workers=4):
+        self.backend = backend
+        self.drafts_dir = drafts_dir
+        self.template = template or load_prompt()
+        self.max_workers = max_workers
+
+    def _manifest_path(self):
+        return os.path.join(self.drafts_dir, 'manifest.json')
+
+    def _read_manifest(self):
+        if not os.path.exists(self._manifest_path()):
+            return {}
+        with open(self._manifest_path(), 'r') as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        with tempfile.NamedTemporaryFile('w', dir=self.drafts_dir, delete=False) as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(f.name, self._manifest_path())
+
+    def draft_path(self, geo, quarter):
+        year, quarter = split_quarter(quarter)
+        return os.path.join(year, quarter, f'{file_codes.get(geo, geo)}.md')
+
+    def jobs(self, data, names, quarters=None):
+        '''
+        Return the drafts to write, as (path, hash, prompt, geo, quarter, context) tuples. The
+        quarters must be quarters of the data (e.g. 23-Q4), all by default.
+        '''
+        quarters = list(data.quarters) if quarters is None else quarters
+        unknown = [quarter for quarter in quarters if quarter not in data.quarters]
+        if unknown:
+            # The context would silently hold the data up to the last quarter available instead
+            raise ValueError(f'unknown quarters {unknown}: the data holds the quarters from {data.quarters[0]} to {data.quarters[-1]}')
+        jobs = []
+        for geo in data.geos:
+            for quarter in quarters:
+                context = quarter_context(data, geo, quarter)
+                prompt = fill_prompt(self.template, geo, names.get(geo, geo), quarter, context)
+                jobs.append((self.draft_path(geo, quarter), input_hash(self.backend, prompt), prompt, geo, quarter, context))
+        return jobs
+
+    def _write(self, job):
+        path, _, prompt, geo, quarter, context = job
+        draft = self.backend.generate(prompt, geo, quarter, context)
+        os.makedirs(os.path.dirname(os.path.join(self.drafts_dir, path)), exist_ok=True)
+        with open(os.path.join(self.drafts_dir, path), 'w') as f:
+            f.write(draft)
+        debug_print(f'Draft written: {path}')
+
+    def run(self, data, names, quarters=None):
+        '''
+        Generate the drafts whose inputs changed, and return their paths (relative to the drafts
+        folder).
+        '''
+        os.makedirs(self.drafts_dir, exist_ok=True)
+        manifest = self._read_manifest()
+        jobs = [job for job in self.jobs(data, names, quarters)
+                if manifest.get(job[0]) != job[1] or not os.path.exists(os.path.join(self.drafts_dir, job[0]))]
+        info_print(f'{len(jobs)} drafts to generate with the {self.backend.name} backend')
+        if not jobs:
+            return []
+
+        self.backend.load()
+        written = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for job, future in [(job, executor.submit(self._write, job)) for job in jobs]:
+                try:
+                    future.result()
+                    manifest[job[0]] = job[1]
+                    written.append(job[0])
+                except Exception as e:
+                    # The other drafts are kept, this one will be generated by the next run
+                    error_print(f'generation of {job[0]} failed: {e}')
+
+        self._write_manifest(manifest)
+        return written
+
+
+def main():
+    from refresh_scheduler import artifact_key
+
+    parser = argparse.ArgumentParser(description='Generate the drafts of the DTPI highlights.')
+    parser.add_argument('--backend', default='stub', help='stub, t5 or t5:<model name>')
+    parser.add_argument('--cache-dir', default=default_cache_dir, help='folder of the processed data')
+    parser.add_argument('--drafts-dir', default=default_drafts_dir, help='folder the drafts are written to')
+    parser.add_argument('--quarter', action='append', help='quarter to generate, e.g. 24-Q1 (all by default)')
+    parser.add_argument('--workers', type=int, default=4, help='number of drafts generated concurrently')
+    args = parser.parse_args()
+
+    tables = ArrowCacheBackend(args.cache_dir).open_tables(artifact_key)
+    if tables is None:
+        error_print(f'no processed data in {args.cache_dir}: run refresh_scheduler.py --once first')
+        return
+    data = DTPIData.from_arrow(tables[artifact_key])
+
+    pipeline = HighlightsPipeline(get_backend(args.backend), args.drafts_dir, max_workers=args.workers)
+    try:
+        written = pipeline.run(data, dict(zip(settings.countries, settings.country_titles)), args.quarter)
+    except ValueError as e:
+        error_print(e)
+        return
+    info_print(f'{len(written)} drafts written to {args.drafts_dir}')
+
+
+if __name__ == '__main__':
+    main()
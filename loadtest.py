@@ -0,0 +1,291 @@
+import os
+import sys
+import time
+import tomllib
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+
+from collections import Counter
+
+# Making sure to leverage upon absolute paths (avoid deployment issues)
+prt_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Pages of the app (see app.py), visited in this order by each simulated session; the country
+# tabs are all rendered by the run of the last page
+pages = ['Home', 'Intro: DTPI', 'Overview of EU27 DTPI', 'Zoom into EU27 and EU6 DTPI']
+# Step selecting as many countries as the guardrails allow (see settings.py) on the overview page,
+# the worst case of its multiselect
+compare_most = 'Overview of EU27 DTPI (most selected)'
+
+# Local fixture used instead of Eurostat, see data_sources.py
+default_source = 'excel:data/Index_v2_loc.xlsx'
+
+
+def session_secrets(source):
+    '''
+    Return the secrets of the app, with the data source replaced by the fixture and the background
+    refresh turned off, not to measure it along with the pages.
+    '''
+    with open(os.path.join(prt_dir, '.streamlit', 'secrets.toml'), 'rb') as f:
+        secrets = tomllib.load(f)
+    secrets.update({'VERBOSITY': 'error', 'DATA_SOURCE': source, 'REFRESH_SCHEDULER': 'off'})
+
+    return secrets
+
+
+def rss():
+    '''
+    Return the resident memory of the process, in MB.
+    '''
+    with open('/proc/self/statm', 'r') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+
+class StackSampler(threading.Thread):
+    '''
+    Sample the stacks of the other threads of the process (the app runs in script threads of its
+    own, out of reach of cProfile) and count, for each line of app.py and each function of the
+    other modules of the repository, the samples it appears in: the share of the time spent in it.
+    '''
+    def __init__(self, interval=0.005):
+        super().__init__(name='dtpi-sampler', daemon=True)
+        self.interval = interval
+        self.samples = 0
+        self.counts = Counter()
+        self._stop_event = threading.Event()
+
+    def _label(self, frame):
+        path = frame.f_code.co_filename
+        # The threads driving the sessions run this file, they only wait for the script threads
+        if not path.startswith(prt_dir) or path == os.path.abspath(__file__):
+            return None
+        name = os.path.basename(path)
+        # app.py is a script: its lines tell the page elements apart
+        return f'{name}:{frame.f_lineno}' if name == 'app.py' else f'{name}:{frame.f_code.co_name}'
+
+    def run(self):
+        ignored = {threading.get_ident(), threading.main_thread().ident}
+        while not self._stop_event.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident in ignored:
+                    continue
+                labels = set()
+                while frame is not None:
+                    labels.add(self._label(frame))
+                    frame = frame.f_back
+                labels.discard(None)
+                if labels:
+                    self.samples += 1
+                    self.counts.update(labels)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_session(session, source, iterations, timeout, start, latencies):
+    '''
+    Simulate a session, visiting all the pages for the given number of iterations once all the
+    sessions are ready to start, and add the latency of each visit to latencies.
+    '''
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(prt_dir, 'app.py'), default_timeout=timeout)
+    at.secrets.update(session_secrets(source))
+
+    def visit(step, action):
+        begin = time.perf_counter()
+        action().run()
+        latencies.append((session, step, time.perf_counter() - begin))
+        if at.exception:
+            raise RuntimeError(f'session {session}, {step}: {at.exception[0].message}')
+
+    def select_most():
+        multiselect = at.multiselect[0]
+        return multiselect.set_value(list(multiselect.options)[:multiselect.max_selections])
+
+    start.wait()
+    # First run, landing on the home page
+    visit(pages[0], lambda: at)
+    for _ in range(iterations):
+        for page in pages:
+            visit(page, lambda: at.radio[0].set_value(page))
+        at.radio[0].set_value(pages[2]).run()
+        visit(compare_most, select_most)
+        # Back to the default selection for the next iteration
+        at.multiselect[0].set_value([])
+
+
+def run_sessions(args):
+    '''
+    Run the given number of concurrent sessions as threads of this process, the way the server
+    runs them, and return the latency of each visit along with the CPU time and memory of the
+    process.
+    '''
+    sessions, source, iterations, timeout, profile = args
+    # Only the errors of Streamlit itself: its logger level is set from the config whenever it is
+    # parsed (the development mode of a source checkout turns the debug logs on)
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    config.set_option('logger.level', 'error')
+    set_log_level('error')
+    # Imported here, unused, to warm up Streamlit: the memory of the process before the first
+    # session (rss start) includes Streamlit and its testing harness, so that the memory added
+    # by the sessions is measured alone
+    import streamlit.testing.v1  # noqa: F401
+    rss_start = rss()
+    latencies = []
+    errors = []
+    start = threading.Barrier(sessions)
+
+    def target(session):
+        try:
+            run_session(session, source, iterations, timeout, start, latencies)
+        except Exception as e:
+            errors.append(e)
+            start.abort()
+
+    threads = [threading.Thread(target=target, args=(session,), name=f'dtpi-session-{session}')
+               for session in range(sessions)]
+    sampler = StackSampler() if profile else None
+    if sampler:
+        sampler.start()
+    cpu_start = time.process_time()
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - begin
+    if sampler:
+        sampler.stop()
+    if errors:
+        raise errors[0]
+
+    return {
+        'sessions': sessions,
+        'latencies': latencies,
+        'elapsed': elapsed,
+        # Across all the threads of the process
+        'cpu': time.process_time() - cpu_start,
+        'rss_start': rss_start,
+        'rss': rss(),
+        # Peak resident memory, in kB on Linux
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'samples': sampler.samples if sampler else 0,
+        'counts': sampler.counts if sampler else Counter(),
+    }
+
+
+def warm_up(source, cache_dir):
+    '''
+    Build the processed data before the sessions start, as the refresh worker would, and return
+    the time it took.
+    '''
+    from data_cache import ArrowCacheBackend
+    from data_sources import get_data_source
+    from refresh_scheduler import RefreshScheduler
+
+    start = time.perf_counter()
+    RefreshScheduler(get_data_source(source, cache_dir), ArrowCacheBackend(cache_dir)).check()
+
+    return time.perf_counter() - start
+
+
+def report(result):
+    '''
+    Return the latency percentiles by page of a run of concurrent sessions.
+    '''
+    import pandas as pd
+
+    latencies = pd.DataFrame(result['latencies'], columns=['session', 'page', 'latency'])
+    # The first visit of a session includes the imports of the app, it is reported aside
+    first = latencies.groupby('session').head(1)
+    latencies = latencies.drop(first.index)
+
+    by_page = latencies.groupby('page', sort=False)['latency'].describe(percentiles=[.5, .9, .99])
+    by_page = by_page[['count', '50%', '90%', '99%', 'max']].rename(columns={'50%': 'p50', '90%': 'p90', '99%': 'p99'})
+    by_page.loc['first run'] = [len(first), *first['latency'].quantile([.5, .9, .99]), first['latency'].max()]
+
+    return by_page
+
+
+def report_scaling(results):
+    '''
+    Return the latency, CPU time and resident memory of the process against the number of
+    concurrent sessions, with the memory each session adds to it.
+    '''
+    import pandas as pd
+
+    rows = []
+    for result in results:
+        latency = pd.Series([latency for _, _, latency in result['latencies']])
+        rows.append({
+            'sessions': result['sessions'],
+            'elapsed (s)': result['elapsed'],
+            'p50 (s)': latency.quantile(.5),
+            'p90 (s)': latency.quantile(.9),
+            'cpu (s)': result['cpu'],
+            'rss start (MB)': result['rss_start'],
+            'rss (MB)': result['rss'],
+            'peak rss (MB)': result['peak_rss'],
+        })
+    table = pd.DataFrame(rows).set_index('sessions')
+    # Memory added by each session over the previous number of sessions: the first one also loads
+    # the app and the data into the process
+    sessions = table.index.to_series()
+    table['added / session (MB)'] = (table['peak rss (MB)'].diff() / sessions.diff()).fillna(
+        (table['peak rss (MB)'] - table['rss start (MB)']) / sessions)
+
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the app with concurrent simulated sessions.')
+    parser.add_argument('--sessions', type=lambda value: [int(n) for n in value.split(',')], default=[1, 2, 4],
+                        help='numbers of concurrent sessions to run, comma separated, e.g. 1,2,4,8')
+    parser.add_argument('--iterations', type=int, default=5, help='visits of all the pages by each session')
+    parser.add_argument('--source', default=default_source, help='data source, e.g. excel:<path> or local:<path>')
+    parser.add_argument('--timeout', type=float, default=60, help='timeout of a run, in seconds')
+    parser.add_argument('--profile', action='store_true', help='sample the sessions and print the hot spots')
+    parser.add_argument('--top', type=int, default=25, help='number of hot spots printed')
+    args = parser.parse_args()
+
+    # The sessions share a fresh cache folder, as the processes of a node share theirs
+    os.chdir(prt_dir)
+    sys.path.insert(0, prt_dir)
+    cache_dir = tempfile.mkdtemp(prefix='dtpi_loadtest_')
+    os.environ['DTPI_CACHE_DIR'] = cache_dir
+
+    print(f'Processed data built in {warm_up(args.source, cache_dir):.2f}s')
+
+    # The sessions of a number run as threads of a single fresh process, as in the server: they
+    # share its caches and its interpreter, and its memory is measured against their number
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for sessions in args.sessions:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_sessions, ((sessions, args.source, args.iterations, args.timeout, args.profile),))
+        results.append(result)
+        print(f'\n{sessions} sessions, {args.iterations} iterations, {result["elapsed"]:.2f}s\n')
+        print(report(result).to_markdown(floatfmt='.3f'))
+
+    print('\nProcess against concurrent sessions\n')
+    print(report_scaling(results).to_markdown(floatfmt='.2f'))
+
+    if args.profile:
+        # Where the time goes under the heaviest load: data loading, index, figures or markdown
+        import pandas as pd
+
+        result = results[-1]
+        hot_spots = pd.DataFrame(result['counts'].most_common(args.top), columns=['location', 'samples']).set_index('location')
+        hot_spots['share'] = hot_spots['samples'] / max(result['samples'], 1)
+        print(f'\n{result["samples"]} samples of the script threads, {result["sessions"]} sessions\n')
+        print(hot_spots.to_markdown(floatfmt='.3f'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import os
+import json
+import argparse
+import tempfile
+import threading
+
+from data_cache import ArrowCacheBackend, FileLock, get_cache_backend, get_or_refresh, default_cache_dir
+from data_processing import build_dtpi_data, filter_series
+from data_sources import get_data_source
+from vintage_store import VintageStore, default_vintage_dir
+from utils import debug_print, info_print, error_print
+
+# Keys of the processed artifact and of the raw frames in their caches
+artifact_key = 'dtpi'
+raw_key = 'eurostat'
+
+# By default, the source is polled every 6 hours
+default_interval = 6 * 60 * 60
+
+
+class RefreshScheduler(threading.Thread):
+    '''
+    Poll the data source for updates and, when a dataset has been updated, rebuild the processed
+    artifact in the background and swap it in.
+
+    The swap is atomic: the new Arrow file is written aside and renamed over the current one, the
+    sessions keep on reading the previous mapping until they map the new file on their next run.
+    The last update timestamps are recorded next to the artifact, so that all the processes of the
+    node (and a separate worker, see main) agree on what has already been built. When a vintage
+    store is given, the revisions of the series are recorded there at each refresh.
+    '''
+    def __init__(self, source, store, raw_cache=None, interval=default_interval, build=build_dtpi_data,
+                 vintage_store=None):
+        super().__init__(name='dtpi-refresh', daemon=True)
+        self.source = source
+        self.store = store
+        self.raw_cache = raw_cache or get_cache_backend('memory', store.cache_dir)
+        self.interval = interval
+        self.build = build
+        self.vintage_store = vintage_store
+        self._stop_event = threading.Event()
+
+    def _stamps_path(self):
+        return os.path.join(self.store.cache_dir, f'{artifact_key}.stamps.json')
+
+    def read_stamps(self):
+        '''
+        Return the last update timestamps of the data the current artifact was built from.
+        '''
+        if not os.path.exists(self._stamps_path()):
+            return None
+        with open(self._stamps_path(), 'r') as f:
+            return json.load(f)
+
+    def _write_stamps(self, stamps):
+        with tempfile.NamedTemporaryFile('w', dir=self.store.cache_dir, delete=False) as f:
+            json.dump(stamps, f)
+        os.replace(f.name, self._stamps_path())
+
+    def _is_up_to_date(self, stamps):
+        return stamps == self.read_stamps() and self.store.open_tables(artifact_key) is not None
+
+    def check(self):
+        '''
+        Poll the data source and rebuild the artifact if it has been updated. It returns True when
+        the artifact has been rebuilt.
+        '''
+        stamps = self.source.last_updated()
+        if self._is_up_to_date(stamps):
+            debug_print(f'{self.source.name} data is up to date')
+            return False
+
+        with FileLock(os.path.join(self.store.cache_dir, f'{artifact_key}.lock')):
+            # Another process may have rebuilt the artifact while waiting for the lock
+            if self._is_up_to_date(stamps):
+                return False
+
+            info_print(f'{self.source.name} data has been updated: rebuilding the artifact')
+            # The cached raw frames are outdated as well
+            self.raw_cache.invalidate(raw_key)
+            frames = get_or_refresh(self.raw_cache, raw_key, self.source.fetch)
+            if self.vintage_store is not None:
+                # All the countries are recorded, not only the ones shown
+                self.vintage_store.append(filter_series(frames['GVA'], frames['employment'], frames['labour_demand']), stamps)
+            data = self.build(frames)
+            self.store.store(artifact_key, {artifact_key: data.to_arrow()})
+            self._write_stamps(stamps)
+            info_print('The artifact has been swapped in')
+
+        return True
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                # Keep on serving the current artifact, the next poll will try again
+                error_print(f'refresh of the {self.source.name} data failed: {e}')
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh the processed DTPI data in the background.')
+    parser.add_argument('--source', default='eurostat', help='eurostat, local:<path to the folder> or excel:<path to the workbook>')
+    parser.add_argument('--cache-dir', default=default_cache_dir, help='folder shared with the app')
+    parser.add_argument('--vintage-dir', default=default_vintage_dir, help='folder of the vintage store')
+    parser.add_argument('--interval', type=int, default=default_interval, help='polling interval, in seconds')
+    parser.add_argument('--once', action='store_true', help='check once and exit')
+    args = parser.parse_args()
+
+    scheduler = RefreshScheduler(get_data_source(args.source, args.cache_dir), ArrowCacheBackend(args.cache_dir),
+                                 interval=args.interval, vintage_store=VintageStore(args.vintage_dir))
+    if args.once:
+        scheduler.check()
+        return
+
+    # Run the polling loop in the foreground
+    scheduler.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import threading
+
+from collections import OrderedDict
+
+import pandas as pd
+
+import settings
+
+from data_model import DTPIData
+from utils import debug_print, info_print, error_print
+
+# Keys of the session state used by the view
+projections_key = 'dtpi_projections'
+version_key = 'dtpi_version'
+rendered_key = 'dtpi_rendered'
+
+# Data shared by all the sessions of the process, built once per artifact
+_shared = {'table': None, 'data': None, 'version': 0}
+_shared_lock = threading.Lock()
+
+
+def get_shared_data(table):
+    '''
+    Return the data over the mapped artifact, shared (read-only) by all the sessions of the
+    process, along with its version. Nothing is copied: the values of a country are read from the
+    mapped file when a session projects them (see DTPIData.map_arrow).
+    '''
+    with _shared_lock:
+        # The table is kept referenced, so that its identity tells whether the artifact changed
+        if _shared['table'] is not table:
+            _shared['data'] = DTPIData.map_arrow(table)
+            _shared['table'] = table
+            _shared['version'] += 1
+            info_print(f'Shared data mapped, version {_shared["version"]}')
+        return _shared['data'], _shared['version']
+
+
+class SessionView:
+    '''
+    View of a session over the data shared across the sessions.
+
+    The shared data is never copied nor modified by the sessions: a page asks the view for the
+    small projections it renders (e.g. the DTPI of the selected countries, or the series of a
+    country), which are kept in the session state to be reused by the next reruns.
+
+    Two guardrails bound what a session costs. The number of countries compared at once on the
+    overview page is capped (one box plot and one line each). And the memory a session holds in
+    the server is accounted for, against a budget: the images of the figures rendered by its run
+    (kept in the media storage of the server until its next run), the payloads of its charts, and
+    the projections kept across the reruns (pandas deep memory usage). Over budget, the least
+    recently used projections are evicted, and the pages stop rendering further countries.
+    '''
+    def __init__(self, data, version, state, max_series=settings.max_rendered_series,
+                 memory_budget=settings.session_memory_budget):
+        self.data = data
+        self.state = state
+        self.max_series = max_series
+        self.memory_budget = memory_budget
+
+        # The projections of a previous artifact are outdated
+        if state.get(version_key) != version or projections_key not in state:
+            state[projections_key] = OrderedDict()
+            state[version_key] = version
+        # A view is created by each run: the rendering of the previous run is released with it
+        state[rendered_key] = 0
+
+    @property
+    def projections(self):
+        return self.state[projections_key]
+
+    def limit(self, geos):
+        '''
+        Return the given geos, up to the maximum number compared at once (max_series).
+        '''
+        geos = list(geos)
+        if len(geos) > self.max_series:
+            debug_print(f'{len(geos)} countries selected: rendering only the first {self.max_series}')
+        return geos[:self.max_series]
+
+    def memory_usage(self):
+        '''
+        Return the memory held by the session, in bytes: what its run rendered, and its projections.
+        '''
+        return self.state[rendered_key] + sum(nbytes for _, nbytes in self.projections.values())
+
+    def within_budget(self):
+        return self.memory_usage() <= self.memory_budget
+
+    def _evict(self):
+        while self.projections and not self.within_budget():
+            evicted, _ = self.projections.popitem(last=False)
+            debug_print(f'Session over its memory budget: evicting {evicted}')
+
+    def charge(self, nbytes, what):
+        '''
+        Account for the bytes rendered by the run (e.g. the image of a figure).
+        '''
+        self.state[rendered_key] += nbytes
+        self._evict()
+        if not self.within_budget():
+            error_print(f'session over its memory budget of {self.memory_budget} bytes, rendering a {what} of {nbytes} bytes')
+
+    def _project(self, key, build):
+        if key in self.projections:
+            self.projections.move_to_end(key)
+            return self.projections[key][0]
+
+        frame = build()
+        self.projections[key] = (frame, int(frame.memory_usage(deep=True).sum()))
+        self._evict()
+        return frame
+
+    def index_frame(self, geos):
+        '''
+        Return the DTPI of the given geos (one column per geo). The selections of the user are
+        expected to be limited beforehand, see limit.
+        '''
+        geos = tuple(geos)
+        return self._project(('index',) + geos, lambda: self.data.index_frame(geos))
+
+    def country_frame(self, geo):
+        '''
+        Return the series a country is rendered with: its measures, at the value and normalized
+        stages (first level of the columns), and its DTPI (column ('index', 'DTPI')).
+        '''
+        return self._project(('country', geo), lambda: pd.concat({
+            'value': self.data.frame(geo, 'value'),
+            'normalized': self.data.frame(geo, 'normalized'),
+            'index': self.data.index_series(geo).rename('DTPI').to_frame(),
+        }, axis=1))
@@ -0,0 +1,21 @@
+# Parameters of the DTPI, shared by the app and the refresh worker. This module is kept free of
+# imports, so that the app can read it without loading the data stack.
+
+# List of countries for which to process and plot data
+countries = ['EU27_2020', 'IT', 'FR', 'DE', 'ES', 'NL', 'SE']
+country_titles = ['Europe 27 (EU27)', 'Italy (IT)', 'France (FR)', 'Germany (DE)', 'Spain (ES)', 'Netherlands (NL)', 'Sweden (SE)']
+
+# Moving average window
+window = 3
+
+# Weights for the index: w1 - GVA, w2 - Employment, w3 - Labour Demand
+weights = (1, 1, 1)
+
+# Guardrails of the sessions (see session_view.py), set to protect the server from extreme use, not
+# to restrict the normal one: the maximum number of countries compared at once on the overview page,
+# above the six countries of EU6 (it binds only if the list of countries grows)
+max_rendered_series = 10
+# Bytes a session holds in the server: the images of the figures and the charts rendered by its run,
+# and the projections kept for its next reruns. The zoom page renders about 1.6 MB (seven countries,
+# five figures each), the overview page 0.3 MB: beyond the budget, the pages stop rendering
+session_memory_budget = 8 * 1024 * 1024
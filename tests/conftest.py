@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules of the app live at the root of the repository, and read their secrets (see utils.py)
+# from .streamlit/secrets.toml, relative to the working directory
+prt_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, prt_dir)
+os.chdir(prt_dir)
+
+# Countries and quarters of the fixture data
+test_countries = ['IT', 'FR']
+test_quarters = [f'{year}-Q{quarter}' for year in range(2020, 2023) for quarter in range(1, 5)]
+
+
+def write_eurostat_csvs(path, seed=0):
+    '''
+    Write GVA.csv, employment.csv and labour_demand.csv in the Eurostat wide format (one column per
+    quarter), as read by data_sources.LocalSource, with random values.
+    '''
+    rng = np.random.default_rng(seed)
+    columns = {
+        'GVA': {'freq': 'Q', 'unit': 'PC_GDP', 'nace_r2': 'J', 's_adj': 'NSA', 'na_item': 'B1G'},
+        'employment': {'freq': 'Q', 'unit': 'PC_TOT_PER', 'nace_r2': 'J', 's_adj': 'NSA', 'na_item': 'EMP_DC'},
+        'labour_demand': {'freq': 'Q', 'unit': 'PC'},
+    }
+    os.makedirs(path, exist_ok=True)
+    for measure, dimensions in columns.items():
+        rows = []
+        for geo in test_countries:
+            row = dict(dimensions, **{'geo\\TIME_PERIOD': geo})
+            row.update(zip(test_quarters, rng.uniform(1, 10, len(test_quarters)).round(2)))
+            rows.append(row)
+        pd.DataFrame(rows).to_csv(os.path.join(path, f'{measure}.csv'), index=False)
+
+
+@pytest.fixture
+def eurostat_csvs(tmp_path):
+    path = tmp_path / 'source'
+    write_eurostat_csvs(path)
+    return path
+
+
+@pytest.fixture(scope='session')
+def workbook_frames():
+    '''
+    Frames (by measure) parsed from the curated workbook, as returned by the excel data source.
+    '''
+    from data_sources import date_start
+    from excel_ingest import read_workbook
+
+    return read_workbook(os.path.join(prt_dir, 'data', 'Index_v2_loc.xlsx'), date_start)
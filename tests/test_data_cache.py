@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_cache
+
+from data_cache import ArrowCacheBackend, get_cache_backend, get_or_refresh
+
+
+def make_frames(seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(size=6)
+    values[1] = np.nan
+    return {
+        'GVA': pd.DataFrame({'geo': ['IT', 'FR'] * 3, 'value': values}),
+        'employment': pd.DataFrame({'geo': ['DE'] * 6, 'value': values[::-1]}),
+    }
+
+
+def assert_same_frames(loaded, frames):
+    assert loaded.keys() == frames.keys()
+    for name, frame in frames.items():
+        # The arrow backend reads the strings back as categories
+        pd.testing.assert_frame_equal(loaded[name].astype({'geo': str}), frame)
+
+
+@pytest.mark.parametrize('name', ['memory', 'disk', 'arrow'])
+def test_store_load_invalidate(name, tmp_path):
+    backend = get_cache_backend(name, str(tmp_path))
+    frames = make_frames()
+
+    assert backend.load('eurostat') is None
+    backend.store('eurostat', frames)
+    assert_same_frames(backend.load('eurostat'), frames)
+
+    backend.invalidate('eurostat')
+    assert backend.load('eurostat') is None
+
+
+@pytest.mark.parametrize('name', ['memory', 'disk', 'arrow'])
+def test_get_or_refresh(name, tmp_path):
+    backend = get_cache_backend(name, str(tmp_path))
+    calls = []
+
+    def refresh():
+        calls.append(1)
+        return make_frames()
+
+    assert_same_frames(get_or_refresh(backend, 'eurostat', refresh), make_frames())
+    assert_same_frames(get_or_refresh(backend, 'eurostat', refresh), make_frames())
+    assert len(calls) == 1
+
+
+def test_arrow_store_failure_keeps_the_previous_version(tmp_path, monkeypatch):
+    backend = ArrowCacheBackend(str(tmp_path))
+    backend.store('eurostat', make_frames(0))
+
+    write_feather = data_cache.feather.write_feather
+    written = []
+
+    def fail_on_second(table, path, **kwargs):
+        if written:
+            raise OSError('disk full')
+        written.append(path)
+        write_feather(table, path, **kwargs)
+
+    # A refresh failing halfway must not leave a partial set of frames to be read as a cache hit
+    monkeypatch.setattr(data_cache.feather, 'write_feather', fail_on_second)
+    with pytest.raises(OSError):
+        backend.store('eurostat', make_frames(1))
+    monkeypatch.undo()
+
+    assert_same_frames(ArrowCacheBackend(str(tmp_path)).load('eurostat'), make_frames(0))
+    assert sorted(os.listdir(tmp_path)) == ['eurostat', os.path.basename(os.path.realpath(tmp_path / 'eurostat'))]
+
+
+def test_arrow_mappings_of_old_versions_are_dropped(tmp_path):
+    backend = ArrowCacheBackend(str(tmp_path))
+    for seed in range(3):
+        backend.store('eurostat', make_frames(seed))
+        assert_same_frames(backend.load('eurostat'), make_frames(seed))
+
+    # Only the files of the current version stay mapped
+    version = os.path.realpath(tmp_path / 'eurostat')
+    assert {os.path.dirname(path) for path in backend._tables} == {version}
+    assert len(backend._tables) == 2
+    # The current version and the previous one are kept on disk
+    assert len([name for name in os.listdir(tmp_path) if name.startswith('eurostat.')]) == 2
+
+    backend.invalidate('eurostat')
+    assert backend._tables == {}
+    assert os.listdir(tmp_path) == []
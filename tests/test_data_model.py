@@ -0,0 +1,73 @@
+import numpy as np
+import pyarrow as pa
+
+from data_cache import ArrowCacheBackend
+from data_model import DTPIData, MappedDTPIData, MEASURES, STAGES
+
+geos = ['EU27_2020', 'IT', 'FR']
+quarters = [f'{year}-Q{quarter}' for year in range(20, 24) for quarter in range(1, 5)]
+
+
+def make_data():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(size=(len(geos), len(MEASURES), len(STAGES), len(quarters)))
+    values[1, 0, 1, :2] = np.nan
+    return DTPIData(geos, quarters, values, rng.uniform(size=(len(geos), len(quarters))))
+
+
+def mapped_table(data, tmp_path):
+    store = ArrowCacheBackend(str(tmp_path))
+    store.store('dtpi', {'dtpi': data.to_arrow()})
+    return store.open_tables('dtpi')['dtpi']
+
+
+def test_arrow_round_trip():
+    data = make_data()
+    table = data.to_arrow()
+
+    # One batch per geo, labels dictionary encoded
+    assert table.num_rows == len(geos) * (len(MEASURES) * len(STAGES) + 1) * len(quarters)
+    assert [batch.num_rows for batch in table.to_batches()] == [table.num_rows // len(geos)] * len(geos)
+    assert all(pa.types.is_dictionary(table.schema.field(column).type) for column in ('geo', 'quarter', 'measure', 'stage'))
+
+    copy = DTPIData.from_arrow(table)
+    assert copy.geos == data.geos and list(copy.quarters) == quarters
+    np.testing.assert_array_equal(copy.values, data.values)
+    np.testing.assert_array_equal(copy.index, data.index)
+
+    selected = DTPIData.from_arrow(table, ['FR'])
+    np.testing.assert_array_equal(selected.values, data.values[[2]])
+
+
+def test_mapped_data_is_not_copied(tmp_path):
+    data = make_data()
+    mapped = DTPIData.map_arrow(mapped_table(data, tmp_path))
+    assert isinstance(mapped, MappedDTPIData)
+    assert mapped.geos == data.geos and list(mapped.quarters) == quarters
+
+    allocated = pa.total_allocated_bytes()
+    for geo in geos:
+        values = mapped.geo_values(geo)
+        assert not values.flags.writeable and not values.flags.owndata
+        np.testing.assert_array_equal(values, data.geo_values(geo))
+        np.testing.assert_array_equal(mapped.geo_index(geo), data.geo_index(geo))
+    # The values are views over the mapped buffers
+    assert pa.total_allocated_bytes() == allocated
+
+    assert mapped.series('IT', 'GVA', 'moving_average').equals(data.series('IT', 'GVA', 'moving_average'))
+    assert mapped.frame('FR', 'normalized').equals(data.frame('FR', 'normalized'))
+    assert mapped.index_frame(['IT', 'FR']).equals(data.index_frame(['IT', 'FR']))
+    np.testing.assert_array_equal(mapped.select(['FR']).values, data.select(['FR']).values)
+    np.testing.assert_array_equal(mapped.values, data.values)
+
+
+def test_map_arrow_reads_the_previous_layout(tmp_path):
+    data = make_data()
+    # Long format with plain strings, as written by the previous releases
+    long_data = data.to_long().reset_index()
+    table = pa.Table.from_pandas(long_data.astype({column: str for column in ('geo', 'quarter', 'measure', 'stage')}),
+                                 preserve_index=False)
+
+    copy = DTPIData.map_arrow(table)
+    assert not isinstance(copy, MappedDTPIData)
+    np.testing.assert_array_equal(copy.values, data.values)
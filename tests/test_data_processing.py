@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import test_countries
+from data_model import DTPIData, MEASURES
+from data_processing import build_dtpi_data
+from data_sources import LocalSource
+
+
+def reference_dtpi(frames, countries, window=3, weights=(1, 1, 1)):
+    '''
+    The per-country computation of the DTPI the app shipped with, before the data model: the
+    filtered series merged quarter by quarter, their moving average, min-max normalized, and the
+    weighted average of the normalized series.
+    '''
+    GVA_data, Employment_data, Labour_demand_ICT_data = frames['GVA'], frames['employment'], frames['labour_demand']
+    w1, w2, w3 = weights
+
+    loaded_data_list = []
+    for country in countries:
+        filtered_data_GVA = GVA_data[(GVA_data['nace_r2'] == 'J') & (GVA_data['unit'] == 'PC_GDP') &
+                                     (GVA_data['geo'] == country) & (GVA_data['na_item'] == 'B1G') &
+                                     (GVA_data['s_adj'] == 'NSA')][['quarter', 'value']]
+        filtered_data_GVA = filtered_data_GVA.rename(columns={'value': f'{country}_GVA_value'})
+        filtered_data_employment = Employment_data[(Employment_data['nace_r2'] == 'J') & (Employment_data['unit'] == 'PC_TOT_PER') &
+                                                   (Employment_data['geo'] == country) & (Employment_data['na_item'] == 'EMP_DC') &
+                                                   (Employment_data['s_adj'] == 'NSA')][['quarter', 'value']]
+        filtered_data_employment = filtered_data_employment.rename(columns={'value': f'{country}_employment_value'})
+        filtered_data_labour_demand = Labour_demand_ICT_data[(Labour_demand_ICT_data['geo'] == country) &
+                                                             (Labour_demand_ICT_data['unit'] == 'PC')][['quarter', 'value']]
+        filtered_data_labour_demand = filtered_data_labour_demand.rename(columns={'value': f'{country}_labour_demand_value'})
+
+        merged_data = pd.merge(filtered_data_GVA, filtered_data_employment, on='quarter', how='inner')
+        merged_data = pd.merge(merged_data, filtered_data_labour_demand, on='quarter', how='inner')
+        loaded_data_list.append(merged_data.set_index('quarter'))
+
+    transformed_data = pd.concat(loaded_data_list, axis=1, join='inner')
+    transformed_data.index = transformed_data.index.strftime('%y-Q%q')
+
+    for country in countries:
+        for measure in MEASURES:
+            moving_average = transformed_data[f'{country}_{measure}_value'].rolling(window=window).mean().dropna()
+            transformed_data[f'{country}_{measure}_moving_average_value'] = moving_average
+            # MinMaxScaler: a constant series is scaled to 0
+            value_range = moving_average.max() - moving_average.min()
+            normalized = (moving_average - moving_average.min())/(value_range if value_range else 1)
+            transformed_data[f'{country}_{measure}_normalized_moving_average_value'] = normalized.reindex(transformed_data.index)
+    transformed_data.dropna(inplace=True)
+
+    index_data = pd.DataFrame(index=transformed_data.index)
+    for country in countries:
+        index_data[country] = (
+            w1*transformed_data[f'{country}_GVA_normalized_moving_average_value'] +
+            w2*transformed_data[f'{country}_employment_normalized_moving_average_value'] +
+            w3*transformed_data[f'{country}_labour_demand_normalized_moving_average_value']
+        )/(w1 + w2 + w3)
+        index_data.dropna(inplace=True)
+
+    return transformed_data, index_data
+
+
+def assert_same_as_reference(frames, countries):
+    data = build_dtpi_data({measure: frame.copy() for measure, frame in frames.items()}, countries=countries)
+    transformed_data, index_data = reference_dtpi(frames, countries)
+
+    assert len(data.quarters) > 0 and list(data.quarters) == list(transformed_data.index)
+    for country in countries:
+        for measure in MEASURES:
+            for stage, suffix in (('value', 'value'), ('moving_average', 'moving_average_value'),
+                                  ('normalized', 'normalized_moving_average_value')):
+                np.testing.assert_allclose(data.series(country, measure, stage).to_numpy(),
+                                           transformed_data[f'{country}_{measure}_{suffix}'].to_numpy(), rtol=0, atol=1e-12)
+        np.testing.assert_allclose(data.index_series(country).to_numpy(), index_data[country].to_numpy(), rtol=0, atol=1e-12)
+
+
+def test_dtpi_as_computed_before_on_the_workbook(workbook_frames):
+    assert_same_as_reference(workbook_frames, ['EU27_2020', 'IT', 'FR', 'DE', 'ES', 'NL', 'SE'])
+
+
+def test_dtpi_as_computed_before_on_csvs(eurostat_csvs):
+    assert_same_as_reference(LocalSource(str(eurostat_csvs)).fetch(), test_countries)
+
+
+def test_from_long_rejects_unknown_labels():
+    long_data = pd.DataFrame({'geo': ['IT', 'IT'], 'quarter': ['20-Q1', '20-Q1'], 'measure': ['GVA', 'typo'],
+                              'stage': ['value', 'value'], 'value': [1.0, 2.0]})
+    with pytest.raises(KeyError, match='typo'):
+        DTPIData.from_long(long_data)
+
+    long_data['measure'] = 'GVA'
+    long_data.loc[1, 'stage'] = 'smoothed'
+    with pytest.raises(KeyError, match='smoothed'):
+        DTPIData.from_long(long_data)
@@ -0,0 +1,46 @@
+import os
+
+import pandas as pd
+
+import excel_ingest
+
+from data_sources import LocalSource, date_start
+from excel_ingest import import_columns, labour_columns, load_workbook
+
+workbook = os.path.join('data', 'Index_v2_loc.xlsx')
+
+
+def test_workbook_frames_as_processed_from_eurostat(workbook_frames, eurostat_csvs):
+    # The same measures processed from the Eurostat format, by process_import_data and
+    # process_ICT_labour_import_data
+    processed = LocalSource(str(eurostat_csvs)).fetch()
+
+    assert workbook_frames.keys() == processed.keys()
+    for measure, frame in workbook_frames.items():
+        assert list(frame.columns) == (labour_columns if measure == 'labour_demand' else import_columns)
+        pd.testing.assert_series_equal(frame.dtypes, processed[measure].dtypes)
+        assert len(frame) > 0 and frame['quarter'].min() >= pd.Period(date_start, freq='Q')
+        assert {'EU27_2020', 'IT', 'FR', 'DE', 'ES', 'NL', 'SE'} <= set(frame['geo'])
+
+
+def test_load_workbook_parses_once(workbook_frames, tmp_path, monkeypatch):
+    read_workbook = excel_ingest.read_workbook
+    calls = []
+
+    def counting_read_workbook(*args, **kwargs):
+        calls.append(args)
+        return read_workbook(*args, **kwargs)
+
+    monkeypatch.setattr(excel_ingest, 'read_workbook', counting_read_workbook)
+
+    first = load_workbook(workbook, date_start, str(tmp_path))
+    second = load_workbook(workbook, date_start, str(tmp_path))
+    assert len(calls) == 1
+    for measure, frame in workbook_frames.items():
+        pd.testing.assert_frame_equal(first[measure], frame)
+        pd.testing.assert_frame_equal(second[measure], frame)
+
+    # A new version of the parser does not read the Parquet files of the previous one
+    monkeypatch.setattr(excel_ingest, 'parser_version', excel_ingest.parser_version + 1)
+    load_workbook(workbook, date_start, str(tmp_path))
+    assert len(calls) == 2
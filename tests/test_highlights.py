@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+
+from data_model import DTPIData, MEASURES, STAGES
+from highlights import HighlightsPipeline, StubBackend, load_prompt
+
+geos = ['EU27_2020', 'IT']
+quarters = [f'23-Q{quarter}' for quarter in range(1, 5)]
+names = {'EU27_2020': 'Europe 27 (EU27)', 'IT': 'Italy (IT)'}
+
+
+def make_data(values=None):
+    rng = np.random.default_rng(0)
+    if values is None:
+        values = rng.uniform(size=(len(geos), len(MEASURES), len(STAGES), len(quarters)))
+    index = values[:, :, STAGES.index('normalized')].mean(axis=1)
+    return DTPIData(geos, quarters, values, index)
+
+
+def make_pipeline(tmp_path):
+    return HighlightsPipeline(StubBackend(), str(tmp_path / 'drafts'), template=load_prompt(), max_workers=2)
+
+
+def test_drafts_are_regenerated_when_their_inputs_change(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    data = make_data()
+
+    written = pipeline.run(data, names)
+    assert sorted(written) == sorted(os.path.join('2023', f'Q{quarter}', f'{code}.md')
+                                     for code in ('EU27', 'IT') for quarter in range(1, 5))
+    with open(tmp_path / 'drafts' / '2023' / 'Q4' / 'IT.md', 'r') as f:
+        assert f.read().startswith('**IT 2023 Q4 Timeframe Analysis**')
+
+    # Nothing changed
+    assert pipeline.run(data, names) == []
+
+    # A revision of IT in 23-Q3 changes the context of its drafts from 23-Q3 on, only
+    values = data.values.copy()
+    values[1, MEASURES.index('GVA'), STAGES.index('normalized'), 2] += 0.1
+    assert sorted(pipeline.run(make_data(values), names)) == [os.path.join('2023', 'Q3', 'IT.md'),
+                                                              os.path.join('2023', 'Q4', 'IT.md')]
+
+    # A missing draft is written again
+    os.remove(tmp_path / 'drafts' / '2023' / 'Q1' / 'EU27.md')
+    assert pipeline.run(make_data(values), names) == [os.path.join('2023', 'Q1', 'EU27.md')]
+
+
+@pytest.mark.parametrize('quarter', ['2023Q1', '24-Q1'])
+def test_unknown_quarters_are_rejected(tmp_path, quarter):
+    pipeline = make_pipeline(tmp_path)
+
+    with pytest.raises(ValueError, match='unknown quarters'):
+        pipeline.run(make_data(), names, [quarter])
+    assert not os.path.exists(tmp_path / 'drafts' / 'manifest.json')
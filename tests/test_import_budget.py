@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import subprocess
+
+from conftest import prt_dir
+
+# Modules the Home page must not load: the plotting and data stacks are imported by the pages
+# needing them. Streamlit imports the plotly package itself (for its theme), not plotly.express
+deferred_modules = ['matplotlib', 'plotly.express', 'pyarrow', 'pandas', 'data_processing', 'data_cache',
+                    'refresh_scheduler', 'vintage_store', 'eurostat']
+
+# The imports done while serving the Home page must take less than this fraction of the time it
+# takes to import the deferred stack
+import_budget = 0.5
+
+# Home is served with the shipped secrets, as deployed: the refresh scheduler in a thread of the app
+render_home = '''
+import sys, json, time, tomllib, threading
+from streamlit.testing.v1 import AppTest
+
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+with open(sys.argv[2], 'rb') as f:
+    at.secrets.update(tomllib.load(f))
+
+print('-- home --', file=sys.stderr, flush=True)
+start = time.perf_counter()
+at.run()
+elapsed = time.perf_counter() - start
+print('-- done --', file=sys.stderr, flush=True)
+
+print(json.dumps({'elapsed': elapsed, 'exceptions': [e.message for e in at.exception],
+                  'modules': [m for m in sys.argv[3:] if m in sys.modules],
+                  'threads': [thread.name for thread in threading.enumerate()]}))
+'''
+
+import_stack = '''
+import matplotlib.pyplot, plotly.express, pyarrow, pandas, data_processing
+'''
+
+
+def run_python(code, *args, marker=None):
+    '''
+    Run the code in a fresh interpreter with -X importtime, and return its output along with the
+    time spent importing modules (between the markers when given), in seconds.
+    '''
+    env = dict(os.environ, STREAMLIT_LOGGER_LEVEL='error')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code, *args], cwd=prt_dir, env=env,
+                            capture_output=True, text=True, check=True)
+    lines = result.stderr.splitlines()
+    if marker is not None:
+        lines = lines[lines.index(f'-- {marker} --') + 1:lines.index('-- done --')]
+    # import time: self [us] | cumulative | imported package (after a header line)
+    self_times = [line[len('import time:'):].split('|')[0].strip() for line in lines if line.startswith('import time:')]
+
+    return result.stdout, sum(int(t) for t in self_times if t.isdigit()) / 1e6
+
+
+def test_home_does_not_import_the_stack():
+    output, home_imports = run_python(render_home, os.path.join(prt_dir, 'app.py'),
+                                      os.path.join(prt_dir, '.streamlit', 'secrets.toml'), *deferred_modules,
+                                      marker='home')
+    home = json.loads(output.splitlines()[-1])
+
+    assert home['exceptions'] == []
+    assert home['modules'] == []
+    # The scheduler is started by the pages showing the data, Home does not poll the source
+    assert 'dtpi-refresh' not in home['threads']
+
+    _, stack_imports = run_python(import_stack)
+    assert home_imports < import_budget * stack_imports, (
+        f'Home imports took {home_imports:.3f}s, the deferred stack {stack_imports:.3f}s')
@@ -0,0 +1,59 @@
+import os
+import json
+
+from functools import partial
+
+from conftest import test_countries, write_eurostat_csvs
+from data_cache import ArrowCacheBackend
+from data_model import DTPIData
+from data_processing import build_dtpi_data
+from data_sources import LocalSource
+from refresh_scheduler import RefreshScheduler, artifact_key
+
+
+def make_scheduler(source_path, cache_dir):
+    return RefreshScheduler(LocalSource(str(source_path)), ArrowCacheBackend(str(cache_dir)),
+                            build=partial(build_dtpi_data, countries=test_countries))
+
+
+def artifact_inode(cache_dir):
+    return os.stat(os.path.join(cache_dir, artifact_key, f'{artifact_key}.arrow')).st_ino
+
+
+def test_check_builds_once(eurostat_csvs, tmp_path):
+    scheduler = make_scheduler(eurostat_csvs, tmp_path / 'cache')
+
+    assert scheduler.check() is True
+    tables = scheduler.store.open_tables(artifact_key)
+    assert tables is not None
+    assert DTPIData.from_arrow(tables[artifact_key]).geos == tuple(test_countries)
+    assert scheduler.read_stamps() == scheduler.source.last_updated()
+
+    # Nothing changed at the source
+    assert scheduler.check() is False
+
+
+def test_check_rebuilds_on_update(eurostat_csvs, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    scheduler = make_scheduler(eurostat_csvs, cache_dir)
+    scheduler.check()
+    stamps = scheduler.read_stamps()
+    inode = artifact_inode(cache_dir)
+    index = DTPIData.from_arrow(scheduler.store.open_tables(artifact_key)[artifact_key]).index
+
+    # New values, with a modification time which surely differs
+    write_eurostat_csvs(eurostat_csvs, seed=1)
+    for measure in ('GVA', 'employment', 'labour_demand'):
+        path = eurostat_csvs / f'{measure}.csv'
+        mtime_ns = os.stat(path).st_mtime_ns + 10**9
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    assert scheduler.check() is True
+    assert artifact_inode(cache_dir) != inode
+    assert scheduler.read_stamps() != stamps
+    with open(cache_dir / f'{artifact_key}.stamps.json', 'r') as f:
+        assert json.load(f) == scheduler.source.last_updated()
+    rebuilt = DTPIData.from_arrow(scheduler.store.open_tables(artifact_key)[artifact_key]).index
+    assert not (rebuilt == index).all()
+
+    assert scheduler.check() is False
@@ -0,0 +1,63 @@
+import numpy as np
+
+from data_model import DTPIData, MEASURES, STAGES
+from session_view import SessionView, projections_key
+
+geos = ['EU27_2020', 'IT', 'FR', 'DE', 'ES', 'NL', 'SE']
+quarters = [f'{year}-Q{quarter}' for year in range(20, 25) for quarter in range(1, 5)]
+
+
+def make_data():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(size=(len(geos), len(MEASURES), len(STAGES), len(quarters)))
+    return DTPIData(geos, quarters, values, rng.uniform(size=(len(geos), len(quarters))))
+
+
+def test_limit():
+    view = SessionView(make_data(), 1, {}, max_series=4)
+
+    assert view.limit(geos[1:]) == geos[1:5]
+    assert view.limit(geos[1:3]) == geos[1:3]
+
+
+def test_projections_are_reused_and_evicted():
+    data = make_data()
+    state = {}
+    view = SessionView(data, 1, state, memory_budget=4 * 1024)
+
+    frame = view.country_frame('IT')
+    assert view.country_frame('IT') is frame
+    assert (frame['index', 'DTPI'] == data.index_series('IT')).all()
+    assert (frame['normalized', 'GVA'] == data.series('IT', 'GVA', 'normalized')).all()
+
+    for geo in geos:
+        view.country_frame(geo)
+    # The least recently used projections are evicted, within the budget
+    assert 0 < view.memory_usage() <= view.memory_budget
+    assert ('country', 'SE') in state[projections_key]
+    assert ('country', 'IT') not in state[projections_key]
+
+    # A new artifact drops the projections of the previous one
+    SessionView(data, 2, state)
+    assert len(state[projections_key]) == 0
+
+
+def test_rendering_is_charged_to_the_run():
+    data = make_data()
+    state = {}
+    view = SessionView(data, 1, state, memory_budget=4 * 1024)
+    view.country_frame('IT')
+    projected = view.memory_usage()
+
+    view.charge(1024, 'figure')
+    assert view.memory_usage() == projected + 1024 and view.within_budget()
+
+    # Over budget: the projections go first, then the page is told to stop rendering
+    view.charge(3 * 1024, 'figure')
+    assert len(state[projections_key]) == 0 and view.within_budget()
+    view.charge(1, 'figure')
+    assert not view.within_budget()
+
+    # The next run starts from what it renders itself
+    view = SessionView(data, 1, state, memory_budget=4 * 1024)
+    assert view.memory_usage() == 0 and view.within_budget()
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from vintage_store import VintageStore, _changed
+
+
+def series(values):
+    '''
+    Build filtered series (see data_processing.filter_series) from {(geo, measure, quarter): value}.
+    '''
+    return pd.DataFrame([{'geo': geo, 'measure': measure, 'quarter': pd.Period(quarter, freq='Q'), 'value': value}
+                         for (geo, measure, quarter), value in values.items()])
+
+
+first = {
+    ('IT', 'GVA', '2023Q1'): 1.0,
+    ('IT', 'GVA', '2023Q2'): np.nan,
+    ('IT', 'GVA', '2023Q3'): 3.0,
+    ('FR', 'GVA', '2023Q1'): 4.0,
+}
+# 2023Q1 revised, 2023Q2 still not available, FR 2023Q1 removed, 2023Q4 added
+second = {
+    ('IT', 'GVA', '2023Q1'): 1.5,
+    ('IT', 'GVA', '2023Q2'): np.nan,
+    ('IT', 'GVA', '2023Q3'): 3.0,
+    ('IT', 'GVA', '2023Q4'): 5.0,
+}
+
+
+def as_dict(series_data):
+    return {(row.geo, row.measure, str(row.quarter)): row.value for row in series_data.itertuples()}
+
+
+def assert_same(actual, expected):
+    actual = as_dict(actual)
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        assert actual[key] == value or (np.isnan(actual[key]) and np.isnan(value))
+
+
+def test_changed():
+    before = pd.Series([1.0, np.nan, np.nan, 1.0, np.nan])
+    after = pd.Series([1.0, np.nan, 2.0, 2.0, np.nan])
+    merge = pd.Series(['both', 'both', 'both', 'both', 'left_only'])
+
+    # NaN is equal to NaN, a removed cell is a change
+    assert _changed(before, after, merge).tolist() == [False, False, True, True, True]
+
+
+def test_append_and_replay(tmp_path):
+    store = VintageStore(tmp_path)
+
+    vintage = store.append(series(first), {'GVA': 'v1'}, recorded='2024-01-01T00:00:00+00:00')
+    assert vintage['id'] == 1 and vintage['cells'] == 4
+    # No revision, no vintage
+    assert store.append(series(first), {'GVA': 'v1'}, recorded='2024-02-01T00:00:00+00:00') is None
+
+    vintage = store.append(series(second), {'GVA': 'v2'}, recorded='2024-03-01T00:00:00+00:00')
+    # The revised, removed and added cells only
+    assert vintage['id'] == 2 and vintage['cells'] == 3
+    assert [vintage['id'] for vintage in store.vintages()] == [1, 2]
+
+    assert_same(store.series_as_of('2024-02-15'), first)
+    assert_same(store.series_as_of(), second)
+    assert_same(store.series_as_of('2023-12-31'), {})
+
+    revisions = store.revisions('2024-02-15')
+    assert set(zip(revisions['geo'], revisions['measure'], revisions['quarter'])) == {
+        ('IT', 'GVA', '2023Q1'), ('IT', 'GVA', '2023Q4'), ('FR', 'GVA', '2023Q1')}
+
+    # A store replayed from the files on disk gives the same series
+    assert_same(VintageStore(tmp_path).series_as_of(), second)
+
+
+def test_data_as_of_before_first_vintage(tmp_path):
+    store = VintageStore(tmp_path)
+    store.append(series(first), recorded='2024-01-01T00:00:00+00:00')
+
+    with pytest.raises(ValueError, match='first vintage'):
+        store.index_as_of('2000-01-01', countries=['IT'])
@@ -0,0 +1,201 @@
+import os
+import json
+import argparse
+import datetime
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import settings
+
+from data_cache import FileLock
+from data_processing import transform_data, compute_index_data
+from utils import debug_print, info_print, error_print
+
+# Making sure to leverage upon absolute paths (avoid deployment issues)
+prt_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Default folder of the store: unlike the caches, the vintages have to survive restarts
+default_vintage_dir = os.getenv('DTPI_VINTAGE_DIR', os.path.join(prt_dir, 'data', 'vintages'))
+
+# A cell of the store is identified by these columns
+key_columns = ['geo', 'measure', 'quarter']
+
+
+class VintageStore:
+    '''
+    Append-only store of the vintages of the filtered series (see data_processing.filter_series).
+
+    Each vintage only holds the cells which changed with respect to the previous one (revised,
+    added or removed values), written as a zstd compressed Parquet file; a vintage with no change
+    is not stored at all. The manifest lists the vintages in order, along with when they have been
+    recorded and the last update timestamps of the source.
+
+    The series as of any past date are rebuilt by replaying the vintages up to that date, which
+    is a single vectorised pass over the (small) deltas, kept in memory once read.
+    '''
+    def __init__(self, path=default_vintage_dir):
+        self.path = path
+        self._deltas = {}
+
+    def _manifest_path(self):
+        return os.path.join(self.path, 'manifest.json')
+
+    def vintages(self):
+        '''
+        Return the list of the vintages, from the oldest to the latest.
+        '''
+        if not os.path.exists(self._manifest_path()):
+            return []
+        with open(self._manifest_path(), 'r') as f:
+            return json.load(f)
+
+    def _read_delta(self, vintage):
+        if vintage['id'] not in self._deltas:
+            delta = pq.read_table(os.path.join(self.path, vintage['file'])).to_pandas()
+            delta['vintage'] = vintage['id']
+            self._deltas[vintage['id']] = delta
+        return self._deltas[vintage['id']]
+
+    def _vintages_as_of(self, as_of):
+        vintages = self.vintages()
+        if as_of is None:
+            return vintages
+        as_of = pd.Timestamp(as_of)
+        if as_of.tzinfo is None:
+            as_of = as_of.tz_localize('UTC')
+        return [vintage for vintage in vintages if pd.Timestamp(vintage['recorded']) <= as_of]
+
+    def _state(self, vintages):
+        if not vintages:
+            return pd.DataFrame(columns=key_columns + ['value'])
+        cells = pd.concat([self._read_delta(vintage) for vintage in vintages], ignore_index=True)
+        # The latest vintage of each cell wins, the removed cells are then dropped
+        cells = cells.drop_duplicates(key_columns, keep='last')
+        cells = cells[~cells['removed']]
+
+        return cells[key_columns + ['value']].sort_values(key_columns).reset_index(drop=True)
+
+    def series_as_of(self, as_of=None):
+        '''
+        Return the filtered series as they were known at the given date (the latest by default),
+        in the format of data_processing.filter_series.
+        '''
+        series_data = self._state(self._vintages_as_of(as_of))
+        series_data['quarter'] = pd.PeriodIndex(series_data['quarter'], freq='Q')
+
+        return series_data
+
+    def data_as_of(self, as_of=None, countries=settings.countries, window=settings.window, weights=settings.weights):
+        '''
+        Compute the processed data, DTPI included, as it would have been computed at the given date.
+        It raises a ValueError when no data had been recorded yet at that date.
+        '''
+        series_data = self.series_as_of(as_of)
+        series_data = series_data[series_data['geo'].isin(countries)]
+        if series_data.empty:
+            first = self.vintages()[0]['recorded'] if self.vintages() else None
+            raise ValueError(f'no data recorded as of {as_of} for {list(countries)}'
+                             + (f': the first vintage has been recorded on {first}' if first else ': the store is empty'))
+
+        return compute_index_data(transform_data(series_data, countries, window), *weights)
+
+    def index_as_of(self, as_of=None, countries=settings.countries, window=settings.window, weights=settings.weights):
+        '''
+        Compute the DTPI (one column per country) as it would have been computed at the given date,
+        see data_as_of.
+        '''
+        return self.data_as_of(as_of, countries, window, weights).index_frame()
+
+    def revisions(self, since, until=None):
+        '''
+        Return the cells revised between two dates, with their value before and after.
+        '''
+        before = self._state(self._vintages_as_of(since))
+        after = self._state(self._vintages_as_of(until))
+        cells = pd.merge(before, after, on=key_columns, how='outer', suffixes=('_before', '_after'), indicator=True)
+
+        return cells[_changed(cells['value_before'], cells['value_after'], cells['_merge'])].drop(columns='_merge')
+
+    def append(self, series_data, stamps=None, recorded=None):
+        '''
+        Record a new vintage of the filtered series, storing only the changed cells. It returns the
+        recorded vintage, or None when nothing changed.
+        '''
+        os.makedirs(self.path, exist_ok=True)
+        recorded = recorded or datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        current = series_data[key_columns + ['value']].copy()
+        current['quarter'] = current['quarter'].astype(str)
+        current['value'] = current['value'].astype(np.float64)
+        current = current.drop_duplicates(key_columns, keep='last')
+
+        with FileLock(os.path.join(self.path, 'manifest.lock')):
+            vintages = self.vintages()
+            previous = self._state(vintages)
+            cells = pd.merge(previous, current, on=key_columns, how='outer', suffixes=('_before', ''), indicator=True)
+            cells = cells[_changed(cells['value_before'], cells['value'], cells['_merge'])]
+            if cells.empty:
+                debug_print('No revision in the series: no vintage recorded')
+                return None
+
+            delta = pd.DataFrame({
+                'geo': cells['geo'].astype(str),
+                'measure': cells['measure'].astype(str),
+                'quarter': cells['quarter'].astype(str),
+                'value': cells['value'].astype(np.float64),
+                'removed': (cells['_merge'] == 'left_only').to_numpy(),
+            })
+            vintage = {
+                'id': len(vintages) + 1,
+                'recorded': recorded,
+                'stamps': stamps,
+                'file': f'{len(vintages) + 1:06d}.parquet',
+                'cells': len(delta),
+            }
+            pq.write_table(pa.Table.from_pandas(delta, preserve_index=False),
+                           os.path.join(self.path, vintage['file']), compression='zstd')
+
+            # The manifest is replaced at once: a vintage exists only once listed
+            with tempfile.NamedTemporaryFile('w', dir=self.path, delete=False) as f:
+                json.dump(vintages + [vintage], f, indent=2)
+            os.replace(f.name, self._manifest_path())
+
+        info_print(f'Recorded vintage {vintage["id"]} with {vintage["cells"]} changed cells')
+        return vintage
+
+
+def _changed(before, after, merge):
+    '''
+    Tell which cells changed: added, removed, or with a different value (NaN equal to NaN).
+    '''
+    both_nan = before.isna() & after.isna()
+    return (merge != 'both') | ((before != after) & ~both_nan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the vintages of the DTPI series.')
+    parser.add_argument('--path', default=default_vintage_dir, help='folder of the store')
+    parser.add_argument('--list', action='store_true', help='list the vintages')
+    parser.add_argument('--as-of', help='print the DTPI as computed at the given date')
+    parser.add_argument('--since', help='print the cells revised since the given date')
+    args = parser.parse_args()
+
+    store = VintageStore(args.path)
+    if args.list:
+        for vintage in store.vintages():
+            print(f'{vintage["id"]:>4} {vintage["recorded"]} {vintage["cells"]} cells')
+    if args.as_of:
+        try:
+            print(store.index_as_of(args.as_of).to_markdown())
+        except ValueError as e:
+            error_print(e)
+    if args.since:
+        print(store.revisions(args.since).to_markdown(index=False))
+
+
+if __name__ == '__main__':
+    main()